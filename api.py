@@ -1,3 +1,6 @@
+import base64
+import hashlib
+import hmac
 import json
 import time
 from typing import Optional, List
@@ -6,8 +9,8 @@ import os
 import httpx
 import socket
 import discord
-from fastapi import FastAPI, Header, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from pydantic import BaseModel, Field
 from starlette.concurrency import run_in_threadpool
 import requests
@@ -17,6 +20,19 @@ from config import (
     ROBLOX_API_KEY,
 )
 
+from bot_api import bridge
+from bot_commands import prime_leaderboard_embed
+from ipc import IPC_PATH
+from sharding import ShardRouter
+from username_index import username_index
+from member_cache import member_cache
+from reconcile import reconciler
+from tracing import TracingMiddleware
+from loop_monitor import loop_monitor
+from profiling import ProfilerBusy, capture as capture_profile
+from db_instrument import query_report
+import tracing
+from metrics import ADMIN_QUEUE_DEPTH, PROFILE_UPDATES, MetricsMiddleware, register_collector, render as render_metrics
 from db import (
     init_db,
     get_code,
@@ -24,20 +40,44 @@ from db import (
     store_link,
     get_link_by_discord,
     get_link_by_roblox_user_id,
+    get_link_status_batch,
     save_player_profile,
+    invalidate_profile_cache,
+    invalidate_guild_settings,
     get_pending_admin_actions,
+    pull_coalesced_admin_actions,
     mark_admin_action_done,
     set_admin_action_result,
+    set_store_purchase_status_for_action,
     list_links,
     list_profiles,
     get_guild_settings,
-    save_leaderboard,
+    merge_leaderboard_contribution,
+    count_pending_admin_actions,
 )
 
 app = FastAPI(title="SLFO API")
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 DISCORD_BOT: Optional[discord.Client] = None
 
+# mode split (main.py api) : pas de bot dans ce process, les effets Discord partent par IPC
+# (un socket par cluster de shards, cf. sharding.py)
+IPC_CLIENT: Optional[ShardRouter] = ShardRouter(IPC_PATH) if os.getenv("SLFO_MODE") == "api" else None
+
+
+def _ipc_metrics() -> list:
+    if IPC_CLIENT is None:
+        return []
+    samples = [({"socket": c.path}, c) for c in IPC_CLIENT.clients]
+    return [
+        ("slfo_ipc_sent_total", "counter", "Effects sent to the bot process", [(l, c.sent) for l, c in samples]),
+        ("slfo_ipc_dropped_total", "counter", "Effects dropped (bot process unreachable)", [(l, c.dropped) for l, c in samples]),
+    ]
+
+register_collector(_ipc_metrics)
+
 
 def set_discord_bot(bot: discord.Client):
     """Call this once from main.py after you create the discord bot."""
@@ -48,6 +88,7 @@ def set_discord_bot(bot: discord.Client):
 @app.on_event("startup")
 async def _startup():
     await init_db()
+    loop_monitor.start()  # même boucle que le bot en mode single
     print("[API] DB init ok")
 
 
@@ -56,6 +97,13 @@ def _check_key(x_api_key: str):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
+def _check_admin_token(x_admin_token: str):
+    # token non configuré -> endpoints admin fermés (avant: un header vide passait)
+    expected = os.environ.get("INTERNAL_ADMIN_TOKEN", "")
+    if not expected or not hmac.compare_digest(x_admin_token.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
 async def _apply_roles(discord_id: int, *, linked: bool, vip: bool, beta: bool):
     """Apply linked/vip/beta roles in every configured guild where the user is present."""
     if DISCORD_BOT is None:
@@ -79,13 +127,13 @@ async def _apply_roles(discord_id: int, *, linked: bool, vip: bool, beta: bool):
             if not any([linked_role, vip_role, beta_role]):
                 continue
 
-            # récupérer le member si présent
-            member = guild.get_member(int(discord_id))
+            # récupérer le member si présent (cache des membres linkés, absence mémorisée)
+            try:
+                member = await member_cache.get(guild, int(discord_id))
+            except Exception:
+                member = None
             if member is None:
-                try:
-                    member = await guild.fetch_member(int(discord_id))
-                except Exception:
-                    continue  # pas dans ce serveur
+                continue  # pas dans ce serveur
 
             to_add = []
             to_remove = []
@@ -110,10 +158,107 @@ async def _apply_roles(discord_id: int, *, linked: bool, vip: bool, beta: bool):
                 await member.add_roles(*to_add, reason="SLFO role sync")
             if to_remove:
                 await member.remove_roles(*to_remove, reason="SLFO role sync")
+            if to_add or to_remove:
+                member_cache.evict(guild.id, member.id)  # member.roles n'est plus à jour
 
         except Exception as e:
             print("[API] _apply_roles guild loop error:", e)
 
+async def _link_confirmed(discord_id: int, roblox_user_id: int, roblox_username: str):
+    """Announce the new link and give the LINKED role in every configured guild where the user is present."""
+    username_index.add(int(roblox_user_id), roblox_username)
+    member_cache.add_linked(int(discord_id))
+
+    if DISCORD_BOT is None:
+        return
+
+    for guild in list(DISCORD_BOT.guilds):
+        try:
+            settings = await get_guild_settings(int(guild.id))
+            if not settings:
+                continue
+
+            # announce
+            announce_id = settings.get("announce_channel_id")
+            if announce_id:
+                embed = discord.Embed(title="🔗 Account Linked", color=0x1ABC9C)
+                embed.add_field(name="Discord", value=f"<@{discord_id}> (`{discord_id}`)", inline=False)
+                embed.add_field(
+                    name="Roblox",
+                    value=f"**{roblox_username}** (`{roblox_user_id}`)",
+                    inline=False
+                )
+                embed.set_footer(text="SLFO — Link System")
+                bridge.post_embed(int(announce_id), embed)
+
+            # give linked role
+            linked_role_id = settings.get("linked_role_id")
+            if not linked_role_id:
+                continue
+
+            try:
+                member = await member_cache.get(guild, int(discord_id))
+            except Exception:
+                member = None
+            if member is None:
+                continue
+
+            role = guild.get_role(int(linked_role_id))
+            if role is not None and role not in member.roles:
+                try:
+                    await member.add_roles(role, reason="SLFO link confirmed (Roblox)")
+                    member_cache.evict(guild.id, member.id)
+                except Exception as e:
+                    print("[API] Role add failed:", e)
+
+        except Exception as e:
+            print("[API] link_confirm guild loop error:", e)
+
+
+async def _post_embed(channel_id: int, embed: dict):
+    bridge.post_embed(int(channel_id), discord.Embed.from_dict(embed))
+
+
+async def _leaderboard_saved(key: str, data: list, updated_at: int):
+    prime_leaderboard_embed(key, data, int(updated_at))
+
+
+async def _profile_saved(roblox_user_id: int):
+    invalidate_profile_cache(int(roblox_user_id))
+
+
+async def _guild_config_changed(guild_id: int):
+    # envoyé par guild_config_set au cluster qui possède le serveur (multi-cluster)
+    invalidate_guild_settings(int(guild_id))
+    reconciler.schedule(int(guild_id), "config")
+
+
+# Effets exécutés par le process qui possède le bot (local en mode single, via IPC en mode split)
+DISCORD_EFFECTS = {
+    "apply_roles": _apply_roles,
+    "link_confirmed": _link_confirmed,
+    "post_embed": _post_embed,
+    "leaderboard_saved": _leaderboard_saved,
+    "profile_saved": _profile_saved,
+    "guild_config_changed": _guild_config_changed,
+}
+
+
+def _discord_enabled() -> bool:
+    return DISCORD_BOT is not None or IPC_CLIENT is not None
+
+
+async def _discord_effect(op: str, route_guild_id: Optional[int] = None, **args):
+    """Run a Discord-side effect here, or forward it to the bot process when the API runs split.
+
+    route_guild_id sends the op only to the cluster owning that guild; without it every cluster gets it.
+    """
+    with tracing.span(f"effect {op}"):
+        if IPC_CLIENT is not None:
+            await IPC_CLIENT.send(op, route_guild_id=route_guild_id, **args)
+            return
+        await DISCORD_EFFECTS[op](**args)
+
 # =========================
 # ===== Link Confirm ======
 # =========================
@@ -153,58 +298,65 @@ async def link_confirm(body: LinkConfirmBody, x_api_key: str = Header(default=""
 
     await store_link(int(discord_id), int(body.roblox_user_id), body.roblox_username)
     await delete_code(code)
-
-    # 🔔 Announce + ✅ give LINKED role in every configured guild where user is present
-    if DISCORD_BOT is not None:
-        for guild in list(DISCORD_BOT.guilds):
-            try:
-                settings = await get_guild_settings(int(guild.id))
-                if not settings:
-                    continue
-
-                # announce
-                announce_id = settings.get("announce_channel_id")
-                if announce_id:
-                    ch = DISCORD_BOT.get_channel(int(announce_id))
-                    if ch is not None:
-                        embed = discord.Embed(title="🔗 Account Linked", color=0x1ABC9C)
-                        embed.add_field(name="Discord", value=f"<@{discord_id}> (`{discord_id}`)", inline=False)
-                        embed.add_field(
-                            name="Roblox",
-                            value=f"**{body.roblox_username}** (`{body.roblox_user_id}`)",
-                            inline=False
-                        )
-                        embed.set_footer(text="SLFO — Link System")
-                        try:
-                            await ch.send(embed=embed)
-                        except Exception as e:
-                            print("[API] announce send failed:", e)
-
-                # give linked role
-                linked_role_id = settings.get("linked_role_id")
-                if not linked_role_id:
-                    continue
-
-                member = guild.get_member(int(discord_id))
-                if member is None:
-                    try:
-                        member = await guild.fetch_member(int(discord_id))
-                    except Exception:
-                        continue
-
-                role = guild.get_role(int(linked_role_id))
-                if role is not None and role not in member.roles:
-                    try:
-                        await member.add_roles(role, reason="SLFO link confirmed (Roblox)")
-                    except Exception as e:
-                        print("[API] Role add failed:", e)
-
-            except Exception as e:
-                print("[API] link_confirm guild loop error:", e)
+    # 🔔 Announce + ✅ give LINKED role (process bot)
+    await _discord_effect(
+        "link_confirmed",
+        discord_id=int(discord_id),
+        roblox_user_id=int(body.roblox_user_id),
+        roblox_username=str(body.roblox_username),
+    )
 
     return {"ok": True}
 
 
+# =========================
+# ===== Link Status ========
+# =========================
+
+LINK_STATUS_BATCH_MAX = 500
+
+
+class LinkStatusBatchBody(BaseModel):
+    roblox_user_ids: List[int]
+
+
+@app.post("/link/status_batch")
+async def link_status_batch(
+    body: LinkStatusBatchBody,
+    x_api_key: str = Header(default=""),
+    if_none_match: str = Header(default=""),
+):
+    _check_key(x_api_key)
+
+    # dédoublonne en gardant l'ordre de la requête
+    ids = list(dict.fromkeys(int(x) for x in body.roblox_user_ids))
+    if len(ids) > LINK_STATUS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {LINK_STATUS_BATCH_MAX})")
+
+    rows = await get_link_status_batch(ids)
+
+    players = []
+    for roblox_user_id, discord_id, vip, beta in rows:
+        players.append({
+            "roblox_user_id": int(roblox_user_id),
+            "linked": discord_id is not None,
+            # string: un snowflake Discord dépasse la précision des nombres Lua
+            "discord_id": str(discord_id) if discord_id is not None else None,
+            "vip": bool(vip),
+            "beta": bool(beta),
+        })
+
+    payload = {"ok": True, "players": players}
+    raw = json.dumps(payload, separators=(",", ":"), sort_keys=True)
+    etag = '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return JSONResponse(content=payload, headers=headers)
+
+
 # =========================
 # ===== Profile Update =====
 # =========================
@@ -225,6 +377,7 @@ class ProfileUpdateBody(BaseModel):
 @app.post("/profile/update")
 async def profile_update(body: ProfileUpdateBody, x_api_key: str = Header(default="")):
     _check_key(x_api_key)
+    PROFILE_UPDATES.inc()
 
     payload = {
         "roblox_user_id": int(body.roblox_user_id),
@@ -240,13 +393,16 @@ async def profile_update(body: ProfileUpdateBody, x_api_key: str = Header(defaul
     }
 
     await save_player_profile(int(body.roblox_user_id), json.dumps(payload, ensure_ascii=False))
+    # cache profil du process bot (no-op de plus en mode single)
+    await _discord_effect("profile_saved", roblox_user_id=int(body.roblox_user_id))
 
     # ✅ If linked -> sync roles (LINKED + VIP + BETA)
     link = await get_link_by_roblox_user_id(int(body.roblox_user_id))
     if link:
         discord_id, _, _, _ = link
-        await _apply_roles(
-            int(discord_id),
+        await _discord_effect(
+            "apply_roles",
+            discord_id=int(discord_id),
             linked=True,
             vip=bool(body.vip),
             beta=bool(body.beta),
@@ -260,19 +416,25 @@ async def profile_update(body: ProfileUpdateBody, x_api_key: str = Header(defaul
 # =========================
 
 @app.get("/admin/actions/pull")
-async def admin_pull(limit: int = 50, x_api_key: str = Header(default="")):
+async def admin_pull(limit: int = 50, coalesce: bool = False, x_api_key: str = Header(default="")):
     _check_key(x_api_key)
 
-    rows = await get_pending_admin_actions()
+    # coalesce=1 : une action nette par (joueur, action) ; ack/report de "id" couvre tous les "ids"
+    if coalesce:
+        actions = await pull_coalesced_admin_actions(int(limit))
+        return {"ok": True, "actions": actions}
+
+    rows = await get_pending_admin_actions(int(limit))
 
     actions = []
-    for r in rows[: int(limit)]:
+    for r in rows:
         actions.append({
             "id": r[0],
             "roblox_user_id": r[1],
             "action": r[2],
             "amount": r[3],
             "queued_at": r[4],
+            "priority": r[5],
         })
 
     return {"ok": True, "actions": actions}
@@ -315,13 +477,16 @@ async def admin_report(body: AdminActionReportBody, x_api_key: str = Header(defa
         success=bool(body.success),
         result_text=str(body.result_text or ""),
     )
+    await set_store_purchase_status_for_action(
+        int(body.action_id),
+        "applied" if body.success else "failed",
+    )
 
     # Discord embed (green/red)
-    if DISCORD_BOT is not None:
+    if _discord_enabled():
         settings = await get_guild_settings(int(OFFICIAL_GUILD_ID))
         log_id = settings.get("admin_log_channel_id") if settings else None
-        ch = DISCORD_BOT.get_channel(int(log_id)) if log_id else None
-        if ch is not None:
+        if log_id:
             color = 0x2ECC71 if body.success else 0xE74C3C
             title = "✅ Admin Action Applied" if body.success else "❌ Admin Action Failed"
 
@@ -338,10 +503,12 @@ async def admin_report(body: AdminActionReportBody, x_api_key: str = Header(defa
                 embed.add_field(name="Info", value=body.result_text[:900], inline=False)
 
             embed.set_footer(text=f"ActionId: {body.action_id}")
-            try:
-                await ch.send(embed=embed)
-            except Exception as e:
-                print("[API] admin log send failed:", e)
+            await _discord_effect(
+                "post_embed",
+                route_guild_id=int(OFFICIAL_GUILD_ID),
+                channel_id=int(log_id),
+                embed=embed.to_dict(),
+            )
 
     return {"ok": True}
 
@@ -351,8 +518,7 @@ class AdminAnnounceBody(BaseModel):
 
 @app.post("/admin/announce")
 async def admin_announce(body: AdminAnnounceBody, x_admin_token: str = Header(default="")):
-    if x_admin_token != os.environ.get("INTERNAL_ADMIN_TOKEN", ""):
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    _check_admin_token(x_admin_token)
 
     universe_id = os.getenv("ROBLOX_UNIVERSE_ID")
     open_cloud_key = os.getenv("ROBLOX_OPEN_CLOUD_KEY")
@@ -389,6 +555,10 @@ async def admin_announce(body: AdminAnnounceBody, x_admin_token: str = Header(de
 
     return {"ok": True}
 
+LEADERBOARD_TOP_K = 10
+LEADERBOARD_CONTRIBUTION_TTL_SECONDS = 600  # un serveur qui ne pousse plus sort du classement
+
+
 class LeaderboardEntry(BaseModel):
     user_id: int
     username: str
@@ -397,6 +567,7 @@ class LeaderboardEntry(BaseModel):
 class LeaderboardUpdateBody(BaseModel):
     key: str  # "points" | "kills" | "robux"
     entries: List[LeaderboardEntry]
+    server_id: str = ""  # game.JobId ; vide = ancien comportement (un seul contributeur)
 
 @app.post("/leaderboard/update")
 async def leaderboard_update(body: LeaderboardUpdateBody, x_api_key: str = Header(default="")):
@@ -406,18 +577,87 @@ async def leaderboard_update(body: LeaderboardUpdateBody, x_api_key: str = Heade
     if key not in ("points", "kills", "robux"):
         raise HTTPException(status_code=400, detail="Invalid leaderboard key")
 
-    # garde uniquement top 10, valeurs >= 0
+    # garde uniquement top K, valeurs >= 0
     cleaned = []
-    for e in (body.entries or [])[:10]:
+    for e in (body.entries or [])[:LEADERBOARD_TOP_K]:
         cleaned.append({
             "user_id": int(e.user_id),
             "username": str(e.username)[:50],
             "value": max(0, int(e.value)),
         })
 
-    await save_leaderboard(key, json.dumps(cleaned, ensure_ascii=False))
+    server_id = (body.server_id or "").strip()[:64] or "default"
+    board = await merge_leaderboard_contribution(
+        key,
+        server_id,
+        json.dumps(cleaned, ensure_ascii=False),
+        ttl_seconds=LEADERBOARD_CONTRIBUTION_TTL_SECONDS,
+        top_k=LEADERBOARD_TOP_K,
+    )
+    await _discord_effect(
+        "leaderboard_saved",
+        key=key,
+        data=board["data"],
+        updated_at=int(board["updated_at"]),
+    )
     return {"ok": True}
 
+# =========================
+# ===== Admin profile =====
+# =========================
+
+@app.post("/admin/profile")
+async def admin_profile(
+    seconds: float = 10,
+    mode: str = "sample",          # "sample" | "cprofile"
+    interval_ms: float = 5,        # mode sample
+    pstats_format: str = Query(default="text", alias="format"),  # mode cprofile : "text" | "pstats" (dump binaire)
+    tracemalloc: bool = False,
+    x_admin_token: str = Header(default=""),
+):
+    """Profile this process for N seconds (the worker that receives the request, in split mode)."""
+    _check_admin_token(x_admin_token)
+    if mode not in ("sample", "cprofile") or pstats_format not in ("text", "pstats"):
+        raise HTTPException(status_code=400, detail="Invalid mode/format")
+
+    try:
+        result = await capture_profile(
+            seconds, mode=mode, interval_ms=interval_ms, pstats_format=pstats_format, with_tracemalloc=tracemalloc
+        )
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    if tracemalloc:
+        if "pstats" in result:
+            result["pstats"] = base64.b64encode(result["pstats"]).decode("ascii")
+        return result
+    if "pstats" in result:
+        return Response(
+            result["pstats"],
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="slfo.prof"'},
+        )
+    return Response(result.get("collapsed") or result.get("text") or "", media_type="text/plain")
+
+@app.get("/admin/db/queries")
+async def admin_db_queries(x_admin_token: str = Header(default="")):
+    """Query plans captured at first execution of each statement, and flagged full scans."""
+    _check_admin_token(x_admin_token)
+    return query_report()
+
+# =========================
+# ======= Metrics =========
+# =========================
+
+@app.get("/metrics")
+async def metrics(x_metrics_token: str = Header(default="")):
+    token = os.getenv("SLFO_METRICS_TOKEN", "")
+    if token and x_metrics_token != token:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    ADMIN_QUEUE_DEPTH.set(await count_pending_admin_actions())
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # =========================
 # ===== Dashboard (/) =====
 # =========================
@@ -430,7 +670,8 @@ async def dashboard():
     async def discord_label(discord_id: int) -> str:
         if DISCORD_BOT is None:
             return f"<span class='muted'>@unknown</span> <span class='muted'>({discord_id})</span>"
-        user = DISCORD_BOT.get_user(int(discord_id))
+        # cache discord.py désactivé (MemberCacheFlags.none()) -> repli sur les membres linkés déjà vus
+        user = DISCORD_BOT.get_user(int(discord_id)) or member_cache.any_member(int(discord_id))
         if user:
             # discriminator may be "0" on newer accounts, but it's fine for display
             return f"{html.escape(user.name)}#{html.escape(getattr(user, 'discriminator', '0'))} <span class='muted'>({discord_id})</span>"
@@ -0,0 +1,318 @@
+# bench/db_bench.py
+# Micro-benchmarks de chaque fonction de db.py sur une base de taille réaliste, comparés à une baseline.
+# La base est remplie une fois (sqlite3, executemany) dans un modèle réutilisé, puis copiée à chaque run :
+# les fonctions d'écriture partent toujours du même état.
+#
+#   python bench/db_bench.py --save-baseline                 # première mesure (bench/results/db_baseline.json)
+#   python bench/db_bench.py                                  # compare, exit 1 si une fonction régresse
+#   python bench/db_bench.py --links 10000 --profiles 10000 --actions 100000 --only link
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SLFO_SLOW_QUERY_MS", "60000")  # pas de slow log pendant le bench
+os.environ.setdefault("SLFO_TRACE_FILE", "")
+
+import db
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, "db_baseline.json")
+
+DISCORD_BASE = 10**17
+ROBLOX_BASE = 10**6
+GUILDS = 50
+LEADERBOARD_SERVERS = 50
+LEADERBOARD_TOP_K = 50
+STORE_PURCHASES = 10_000
+SWORD_NAMES = [f"{a} {b}" for a in ("Iron", "Shadow", "Solar", "Frost", "Void", "Crimson") for b in ("Blade", "Katana", "Saber", "Edge", "Fang", "Scythe", "Rapier")]
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# ===== Seed =====
+
+def seed(path: str, links: int, profiles: int, actions: int, pending: int):
+    """Fill an initialized (db.init_db) database with sqlite3 directly."""
+    rnd = random.Random(42)
+    now = int(time.time())
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+
+    conn.executemany(
+        "INSERT INTO links VALUES (?, ?, ?, ?)",
+        ((DISCORD_BASE + i, ROBLOX_BASE + i, f"Player{i}", now - rnd.randrange(86400 * 365)) for i in range(links)),
+    )
+
+    def profile(i):
+        swords = {name: rnd.randint(1, 5) for name in rnd.sample(SWORD_NAMES, rnd.randint(0, len(SWORD_NAMES)))}
+        data = {
+            "roblox_user_id": ROBLOX_BASE + i, "roblox_username": f"Player{i}",
+            "points": rnd.randrange(5_000_000), "bank": rnd.randrange(10**6), "tickets": rnd.randrange(100),
+            "kills": rnd.randrange(10**5), "robux_donated": rnd.randrange(5000), "swords": swords,
+            "vip": i % 7 == 0, "beta": i % 11 == 0,
+        }
+        return ROBLOX_BASE + i, json.dumps(data), now - rnd.randrange(86400 * 30)
+
+    conn.executemany("INSERT INTO player_profiles VALUES (?, ?, ?)", (profile(i) for i in range(profiles)))
+
+    kinds = ("BANK_ADD", "BANK_REMOVE", "HAND_REMOVE", "TICKETS_ADD")
+    priorities = (db.ACTION_PRIORITY_STORE, db.ACTION_PRIORITY_ADMIN, db.ACTION_PRIORITY_BULK)
+
+    def action(i):
+        done = i < actions - pending  # historique traité, les `pending` derniers en attente
+        queued = now - (actions - i)
+        return (
+            ROBLOX_BASE + rnd.randrange(max(1, links)), rnd.choice(kinds), rnd.randint(1, 1000), queued,
+            1 if done else 0, queued + 5 if done else None, 1 if done else None, "ok" if done else None,
+            rnd.choice(priorities),
+        )
+
+    conn.executemany(
+        "INSERT INTO admin_actions (roblox_user_id, action, amount, queued_at, done, done_at, success, result_text, priority) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (action(i) for i in range(actions)),
+    )
+
+    conn.executemany(
+        "INSERT INTO store_purchases (discord_id, roblox_user_id, roblox_username, item_key, cost_points, reward_robux, "
+        "created_at, status, idempotency_key, action_id) VALUES (?, ?, ?, 'robux_100', 1000000, 100, ?, 'applied', ?, ?)",
+        ((DISCORD_BASE + i, ROBLOX_BASE + i, f"Player{i}", now - i, f"seed:{i}", i + 1) for i in range(min(STORE_PURCHASES, links))),
+    )
+    conn.executemany(
+        "INSERT INTO guild_settings VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((g, g + 1, g + 2, g + 3, g + 4, g + 5, now) for g in range(1, GUILDS + 1)),
+    )
+    for key in ("points", "kills", "robux"):
+        for s in range(LEADERBOARD_SERVERS):
+            entries = [{"user_id": ROBLOX_BASE + rnd.randrange(max(1, links)), "username": "p", "value": rnd.randrange(10**6)}
+                       for _ in range(LEADERBOARD_TOP_K)]
+            conn.execute("INSERT INTO leaderboard_contributions VALUES (?, ?, ?, ?)", (key, f"job-{s}", json.dumps(entries), now))
+        conn.execute("INSERT INTO leaderboard_cache VALUES (?, ?, ?)", (key, json.dumps(entries), now))
+    conn.executemany("INSERT INTO link_codes VALUES (?, ?, ?)", ((f"SEED{i:06d}", DISCORD_BASE + i, now) for i in range(1000)))
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+async def prepare_db(args) -> str:
+    template = os.path.join(
+        tempfile.gettempdir(), f"slfo_db_bench_{args.links}_{args.profiles}_{args.actions}_{args.pending}.db"
+    )
+    if args.reseed or not os.path.exists(template):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(template + suffix):
+                os.remove(template + suffix)
+        started = time.perf_counter()
+        db.DB_PATH = template
+        await db.init_db()
+        seed(template, args.links, args.profiles, args.actions, args.pending)
+        print(f"seeded {template} in {time.perf_counter() - started:.1f}s")
+
+    work = os.path.join(tempfile.mkdtemp(), "db_bench.db")
+    shutil.copy(template, work)
+    db.DB_PATH = work
+    await db.init_db()
+    return work
+
+
+# ===== Cas =====
+
+def build_cases(args) -> list:
+    """(name, db function name, iterations, make_call(i) -> coroutine); preparation in make_call is not timed."""
+    rnd = random.Random(7)
+    n_links, n_profiles = max(1, args.links), max(1, args.profiles)
+    it = args.iterations
+    now = int(time.time())
+
+    def link_i():
+        return rnd.randrange(n_links)
+
+    def profile_cold(i):
+        rid = ROBLOX_BASE + rnd.randrange(n_profiles)
+        db.PROFILE_CACHE.pop(rid)
+        return db.get_profile_by_roblox_user_id(rid)
+
+    def settings_cold(i):
+        gid = rnd.randint(1, GUILDS)
+        db.GUILD_SETTINGS_CACHE.pop(gid)
+        return db.get_guild_settings(gid)
+
+    def profile_json(i):
+        return json.dumps({"roblox_user_id": ROBLOX_BASE + i, "points": i, "swords": {n: 1 for n in SWORD_NAMES[:20]}})
+
+    def leaderboard_json():
+        return json.dumps([{"user_id": ROBLOX_BASE + rnd.randrange(n_links), "username": "p", "value": rnd.randrange(10**6)}
+                           for _ in range(LEADERBOARD_TOP_K)])
+
+    def mixed_refs():
+        return [str(ROBLOX_BASE + link_i()) if k % 2 else f"player{link_i()}" for k in range(100)]
+
+    # ids d'actions en attente du seed (les `pending` dernières)
+    first_pending = args.actions - args.pending + 1
+
+    return [
+        # links
+        ("get_link_by_discord", "get_link_by_discord", it, lambda i: db.get_link_by_discord(DISCORD_BASE + link_i())),
+        ("get_link_by_roblox_user_id", "get_link_by_roblox_user_id", it, lambda i: db.get_link_by_roblox_user_id(ROBLOX_BASE + link_i())),
+        ("get_link_by_roblox_username", "get_link_by_roblox_username", it, lambda i: db.get_link_by_roblox_username(f"PLAYER{link_i()}")),
+        ("get_links_by_discord_ids[500]", "get_links_by_discord_ids", it // 4, lambda i: db.get_links_by_discord_ids([DISCORD_BASE + link_i() for _ in range(500)])),
+        ("resolve_links_bulk[100]", "resolve_links_bulk", it // 4, lambda i: db.resolve_links_bulk(mixed_refs())),
+        ("get_link_status_batch[100]", "get_link_status_batch", it // 4, lambda i: db.get_link_status_batch([ROBLOX_BASE + link_i() for _ in range(100)])),
+        ("list_linked_role_flags", "list_linked_role_flags", 3, lambda i: db.list_linked_role_flags()),
+        ("list_links", "list_links", 3, lambda i: db.list_links()),
+        ("store_link", "store_link", it, lambda i: db.store_link(DISCORD_BASE * 2 + i, ROBLOX_BASE * 10 + i, f"New{i}")),
+        ("delete_link", "delete_link", it, lambda i: db.delete_link(DISCORD_BASE * 2 + i)),
+        # codes
+        ("store_code", "store_code", it, lambda i: db.store_code(f"BENCH{i:06d}", DISCORD_BASE + link_i())),
+        ("get_code", "get_code", it, lambda i: db.get_code(f"BENCH{i:06d}")),
+        ("delete_code", "delete_code", it, lambda i: db.delete_code(f"BENCH{i:06d}")),
+        ("delete_unused_codes_for_user", "delete_unused_codes_for_user", it, lambda i: db.delete_unused_codes_for_user(DISCORD_BASE + link_i())),
+        # profils
+        ("save_player_profile", "save_player_profile", it, lambda i: db.save_player_profile(ROBLOX_BASE + link_i(), profile_json(i))),
+        ("get_profile_by_roblox_user_id (cold)", "get_profile_by_roblox_user_id", it, profile_cold),
+        ("list_profiles", "list_profiles", 3, lambda i: db.list_profiles()),
+        # file admin
+        ("enqueue_admin_action", "enqueue_admin_action", it, lambda i: db.enqueue_admin_action(ROBLOX_BASE + link_i(), "BANK_ADD", 10)),
+        ("enqueue_admin_actions_bulk[100]", "enqueue_admin_actions_bulk", it // 4, lambda i: db.enqueue_admin_actions_bulk([(ROBLOX_BASE + link_i(), "BANK_ADD", 1) for _ in range(100)])),
+        ("get_pending_admin_actions[50]", "get_pending_admin_actions", it, lambda i: db.get_pending_admin_actions(50)),
+        ("get_pending_admin_actions[all]", "get_pending_admin_actions", it // 10, lambda i: db.get_pending_admin_actions()),
+        ("has_pending_action", "has_pending_action", it, lambda i: db.has_pending_action(ROBLOX_BASE + link_i(), "HAND_REMOVE")),
+        ("count_pending_admin_actions", "count_pending_admin_actions", it, lambda i: db.count_pending_admin_actions()),
+        ("set_admin_action_result", "set_admin_action_result", it, lambda i: db.set_admin_action_result(first_pending + i % max(1, args.pending), True, "ok")),
+        ("mark_admin_action_done", "mark_admin_action_done", it, lambda i: db.mark_admin_action_done(first_pending + i % max(1, args.pending))),
+        ("pull_coalesced_admin_actions[50]", "pull_coalesced_admin_actions", it // 4, lambda i: db.pull_coalesced_admin_actions(50)),
+        # leaderboard
+        ("get_leaderboard", "get_leaderboard", it, lambda i: db.get_leaderboard(("points", "kills", "robux")[i % 3])),
+        ("save_leaderboard", "save_leaderboard", it, lambda i: db.save_leaderboard("points", leaderboard_json())),
+        ("merge_leaderboard_contribution", "merge_leaderboard_contribution", it // 2,
+         lambda i: db.merge_leaderboard_contribution("kills", f"job-{i % LEADERBOARD_SERVERS}", leaderboard_json(), 3600, LEADERBOARD_TOP_K)),
+        # store
+        ("create_store_purchase", "create_store_purchase", it, lambda i: db.create_store_purchase(
+            DISCORD_BASE + i, ROBLOX_BASE + i, f"Player{i}", "robux_100", 1_000_000, 100, f"bench:{i}")),
+        ("set_store_purchase_status", "set_store_purchase_status", it, lambda i: db.set_store_purchase_status(1 + i, "applied")),
+        ("set_store_purchase_status_for_action", "set_store_purchase_status_for_action", it, lambda i: db.set_store_purchase_status_for_action(1 + i, "applied")),
+        # guild settings / état du bot
+        ("get_guild_settings (cold)", "get_guild_settings", it, settings_cold),
+        ("upsert_guild_settings", "upsert_guild_settings", it, lambda i: db.upsert_guild_settings(1 + i % GUILDS, linked_role_id=i)),
+        ("set_bot_state", "set_bot_state", it, lambda i: db.set_bot_state(f"bench:{i % 10}", str(now))),
+        ("get_bot_state", "get_bot_state", it, lambda i: db.get_bot_state(f"bench:{i % 10}")),
+    ]
+
+
+NOT_BENCHMARKED = {"init_db"}  # migration au démarrage, mesurée par le seed
+
+
+def uncovered(cases: list) -> list:
+    covered = {fn for _, fn, _, _ in cases} | NOT_BENCHMARKED
+    public = [name for name, obj in vars(db).items()
+              if not name.startswith("_") and inspect.iscoroutinefunction(inspect.unwrap(obj)) and getattr(obj, "__module__", "db") == "db"]
+    return sorted(set(public) - covered)
+
+
+async def run_cases(cases: list, only: str) -> dict:
+    results = {}
+    for name, _, iterations, make_call in cases:
+        if only and only not in name:
+            continue
+        iterations = max(1, iterations)
+        lat = []
+        for i in range(iterations):
+            coro = make_call(i)
+            started = time.perf_counter()
+            await coro
+            lat.append((time.perf_counter() - started) * 1000)
+        results[name] = {
+            "n": iterations,
+            "mean_ms": round(sum(lat) / len(lat), 3),
+            "p50_ms": round(percentile(lat, 0.50), 3),
+            "p95_ms": round(percentile(lat, 0.95), 3),
+        }
+        r = results[name]
+        print(f"{name:42s} n={iterations:5d}  p50 {r['p50_ms']:9.3f}ms  p95 {r['p95_ms']:9.3f}ms  mean {r['mean_ms']:9.3f}ms")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list:
+    """Functions whose p50 grew by more than `threshold` % and `min_delta_ms`."""
+    regressions = []
+    print(f"\nvs baseline (p50, fail above +{threshold:.0f}% and +{min_delta_ms}ms):")
+    for name, r in results.items():
+        b = baseline["results"].get(name)
+        if not b:
+            print(f"  {name:42s} (new)")
+            continue
+        delta = r["p50_ms"] - b["p50_ms"]
+        change = delta / b["p50_ms"] * 100 if b["p50_ms"] else 0.0
+        flag = ""
+        if change > threshold and delta > min_delta_ms:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:42s} {b['p50_ms']:9.3f} -> {r['p50_ms']:9.3f}ms ({change:+.0f}%){flag}")
+    return regressions
+
+
+async def run(args) -> dict:
+    await prepare_db(args)
+    cases = build_cases(args)
+    missing = uncovered(cases)
+    if missing:
+        print("[Bench] db.py functions without a benchmark:", ", ".join(missing))
+    print(f"links={args.links} profiles={args.profiles} actions={args.actions} (pending {args.pending})\n")
+    return await run_cases(cases, args.only)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="db.py micro-benchmarks with baseline regression check")
+    parser.add_argument("--links", type=int, default=100_000)
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--actions", type=int, default=1_000_000)
+    parser.add_argument("--pending", type=int, default=2_000, help="admin actions left pending (done=0)")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per function (fewer for bulk/listing ones)")
+    parser.add_argument("--only", default="", help="run the cases whose name contains this")
+    parser.add_argument("--reseed", action="store_true", help="rebuild the seeded template database")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=30.0, help="allowed p50 growth in %%")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore smaller p50 changes (noise)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    sizes = {k: getattr(args, k) for k in ("links", "profiles", "actions", "pending")}
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"at": int(time.time()), "config": sizes, "results": results}, f, indent=2)
+        print(f"\nbaseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nno baseline at {args.baseline} (run with --save-baseline)")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != sizes:
+        print(f"\nbaseline was measured with {baseline.get('config')}, not {sizes}: not comparable")
+        sys.exit(2)
+
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nno regression")
+
+
+if __name__ == "__main__":
+    main()
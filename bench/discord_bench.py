@@ -0,0 +1,320 @@
+# bench/discord_bench.py
+# Débit de synchro des rôles et latence des commandes, hors ligne, contre bench/fake_discord.py.
+# Scénarios (--scenario, plusieurs séparés par des virgules) :
+#   role_sync  : api._apply_roles pour chaque joueur linké (vip/beta variés)
+#   link       : api._link_confirmed pour de nouveaux links (annonce + rôle linked)
+#   join       : départ puis retour des membres linkés -> on_member_join -> join_batcher
+#   reconcile  : reconciler.reconcile_guild sur des guildes avec des rôles en dérive
+#   commands   : /link, /profile (+page suivante), /leaderboard (+kills), /store (choix + confirmation), /unlink
+#
+#   python bench/discord_bench.py --guilds 3 --members 300 --latency 0.05 --role-limit 10/1
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_discord import FakeBot, click, command_tree, invoke, select
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize_ms(values: list) -> dict:
+    return {
+        "n": len(values),
+        "p50_ms": round(percentile(values, 0.50), 1),
+        "p95_ms": round(percentile(values, 0.95), 1),
+        "max_ms": round(max(values), 1) if values else 0.0,
+    }
+
+
+def parse_limit(text: str):
+    """'10/1' -> (10, 1.0) ; 'none' -> None"""
+    if text.lower() == "none":
+        return None
+    limit, per = text.split("/")
+    return int(limit), float(per)
+
+
+class Env:
+    """Fake bot + temp SQLite seeded with linked members, profiles and guild settings."""
+
+    def __init__(self, bot: FakeBot, linked: list):
+        self.bot = bot
+        self.linked = linked  # [(guild, discord_id, roblox_user_id)]
+        self.tree = None
+
+
+async def build_env(args) -> Env:
+    import db
+    import api
+    from bot_api import bridge
+    from bot_commands import on_app_command_error, setup_commands
+    from member_cache import member_cache
+    from reconcile import reconciler
+    from username_index import username_index
+
+    db.DB_PATH = args.db or os.path.join(tempfile.mkdtemp(), "discord_bench.db")
+    await db.init_db()
+
+    bot = FakeBot(
+        guilds=args.guilds,
+        members_per_guild=args.members,
+        latency=args.latency,
+        role_limit=parse_limit(args.role_limit),
+        global_limit=parse_limit(args.global_limit),
+        raise_on_429=args.raise_429,
+    )
+    api.set_discord_bot(bot)
+    bridge.set_bot(bot)
+    reconciler.set_bot(bot)
+
+    linked = []
+    for guild in bot.guilds:
+        await db.upsert_guild_settings(
+            guild.id,
+            linked_role_id=guild.roles["linked"].id,
+            vip_role_id=guild.roles["vip"].id,
+            beta_role_id=guild.roles["beta"].id,
+            announce_channel_id=guild.channels["announce"],
+            admin_log_channel_id=guild.channels["admin_log"],
+        )
+        for n, discord_id in enumerate(list(guild._members)):
+            if n % 2:  # un membre sur deux est linké
+                continue
+            roblox_id = 10**8 + len(linked)
+            await db.store_link(discord_id, roblox_id, f"player{roblox_id}")
+            await db.save_player_profile(roblox_id, json.dumps({
+                "roblox_user_id": roblox_id, "roblox_username": f"player{roblox_id}",
+                "points": random.choice([0, 2_000_000]), "bank": 0, "tickets": 3, "kills": n,
+                "robux_donated": 0, "vip": n % 3 == 0, "beta": n % 5 == 0,
+                "swords": {f"Sword {i}": 1 for i in range(random.randint(0, 40))},
+            }))
+            linked.append((guild, discord_id, roblox_id))
+
+    links = await db.list_links()
+    username_index.load(links)
+    member_cache.load(links)
+
+    env = Env(bot, linked)
+    env.tree = command_tree()
+    setup_commands(env.tree)
+    env.tree.on_error = on_app_command_error
+    return env
+
+
+async def _bounded(coros, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def run(coro):
+        async with sem:
+            return await coro
+    return await asyncio.gather(*(run(c) for c in coros))
+
+
+async def _timed(coro) -> float:
+    started = time.perf_counter()
+    await coro
+    return (time.perf_counter() - started) * 1000
+
+
+# ===== Scénarios =====
+
+async def scenario_role_sync(env: Env, args) -> dict:
+    import api
+
+    started = time.perf_counter()
+    lat = await _bounded([
+        _timed(api._apply_roles(discord_id, linked=True, vip=roblox_id % 3 == 0, beta=roblox_id % 5 == 0))
+        for _, discord_id, roblox_id in env.linked
+    ], args.concurrency)
+    elapsed = time.perf_counter() - started
+    edits = sum(env.bot.rest.calls.get(k, 0) for k in ("role_add", "role_remove"))
+    return {"users": len(env.linked), "role_edits": edits, "edits_per_s": round(edits / elapsed, 1),
+            "elapsed_s": round(elapsed, 2), "per_user": summarize_ms(lat)}
+
+
+async def scenario_link(env: Env, args) -> dict:
+    import api
+    import db
+
+    started = time.perf_counter()
+    jobs = []
+    for guild in env.bot.guilds:
+        for n in range(args.new_links):
+            member = guild.add_member(guild.id * 1000 + 900_000 + n)
+            roblox_id = 2 * 10**8 + len(jobs)
+            await db.store_link(member.id, roblox_id, f"new{roblox_id}")
+            jobs.append(_timed(api._link_confirmed(member.id, roblox_id, f"new{roblox_id}")))
+    lat = await _bounded(jobs, args.concurrency)
+    await _drain_bridge()
+    elapsed = time.perf_counter() - started
+    return {"links": len(jobs), "elapsed_s": round(elapsed, 2), "per_link": summarize_ms(lat),
+            "channel_messages": env.bot.channel_messages()}
+
+
+async def scenario_join(env: Env, args) -> dict:
+    from join_batcher import join_batcher
+    from member_cache import member_cache
+
+    started = time.perf_counter()
+    joins = 0
+    for guild, discord_id, _ in env.linked:
+        guild.remove_member(discord_id)
+        member = guild.add_member(discord_id)  # revient sans rôle
+        member_cache.evict(guild.id, discord_id)
+        if member_cache.is_linked(member.id):  # = main.on_member_join
+            join_batcher.submit(member)
+            joins += 1
+    await join_batcher.drain()
+    elapsed = time.perf_counter() - started
+    return {"joins": joins, "elapsed_s": round(elapsed, 2), **join_batcher.stats()}
+
+
+async def scenario_reconcile(env: Env, args) -> dict:
+    from reconcile import reconciler
+
+    # dérive : rôles linked retirés à la main, rôle vip donné à des non-linkés
+    for guild in env.bot.guilds:
+        members = list(guild._members.values())
+        for member in random.sample(members, min(args.drift, len(members))):
+            if member.roles:
+                member.roles.pop()
+            else:
+                member.roles.append(guild.roles["vip"])
+
+    started = time.perf_counter()
+    reports = []
+    for guild in env.bot.guilds:
+        report = await reconciler.reconcile_guild(guild, "bench")
+        if report:
+            reports.append(report)
+    elapsed = time.perf_counter() - started
+    return {
+        "guilds": len(reports),
+        "scanned": sum(r["scanned"] for r in reports),
+        "added": sum(r["added"] for r in reports),
+        "removed": sum(r["removed"] for r in reports),
+        "errors": sum(r["errors"] for r in reports),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+async def user_session(env: Env, guild, discord_id: int, lat: dict):
+    """One user going through the slash commands and their components; ends unlinked with a fresh code."""
+    bot, tree = env.bot, env.tree
+
+    async def step(name, coro_fn):
+        inter = bot.interaction(guild, discord_id)
+        started = time.perf_counter()
+        await coro_fn(inter)
+        lat.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+        return inter
+
+    profile = await step("profile", lambda i: invoke(tree, "profile", i))
+    if profile.view is not None:
+        await step("profile_next", lambda i: click(profile.view, "next", i))
+
+    board = await step("leaderboard", lambda i: invoke(tree, "leaderboard", i))
+    await step("leaderboard_kills", lambda i: click(board.view, "btn_kills", i))
+
+    store = await step("store", lambda i: invoke(tree, "store", i))
+    if store.view is not None:
+        choose = await step("store_select", lambda i: select(store.view, "robux_100", i))
+        if choose.view is not None:
+            await step("store_confirm", lambda i: click(choose.view, "confirm", i))
+
+    await step("link_existing", lambda i: invoke(tree, "link", i))
+    await step("unlink", lambda i: invoke(tree, "unlink", i))
+    return await step("link_new", lambda i: invoke(tree, "link", i))  # interaction avec le nouveau code
+
+
+async def scenario_commands(env: Env, args) -> dict:
+    lat: dict = {}
+    users = env.linked[:args.command_users]
+    started = time.perf_counter()
+    await _bounded([user_session(env, guild, discord_id, lat) for guild, discord_id, _ in users], args.concurrency)
+    await _drain_bridge()
+    elapsed = time.perf_counter() - started
+    return {"users": len(users), "elapsed_s": round(elapsed, 2),
+            "commands": {name: summarize_ms(v) for name, v in lat.items()}}
+
+
+async def _drain_bridge():
+    # les embeds passent par la file du bridge : attendre qu'elle soit vide
+    from bot_api import bridge
+
+    for _ in range(600):
+        if not any(q["queued"] for q in bridge.log_stats().values()):
+            return
+        await asyncio.sleep(0.1)
+
+
+SCENARIOS = {
+    "role_sync": scenario_role_sync,
+    "link": scenario_link,
+    "join": scenario_join,
+    "reconcile": scenario_reconcile,
+    "commands": scenario_commands,
+}
+
+
+async def run(args) -> dict:
+    env = await build_env(args)
+    print(f"{args.guilds} guilds x {args.members} members ({len(env.linked)} linked), "
+          f"latency {args.latency * 1000:.0f}ms, role limit {args.role_limit}, global {args.global_limit}")
+    results = {}
+    for name in args.scenario.split(","):
+        before = env.bot.rest.stats()
+        results[name] = await SCENARIOS[name](env, args)
+        after = env.bot.rest.stats()
+        results[name]["rate_limited"] = {
+            k: v - before["rate_limited"].get(k, 0) for k, v in after["rate_limited"].items()
+            if v - before["rate_limited"].get(k, 0)
+        }
+        print(f"\n[{name}]")
+        print(json.dumps(results[name], indent=2, ensure_ascii=False))
+    results["rest"] = env.bot.rest.stats()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Role sync / command benchmark against a fake Discord")
+    parser.add_argument("--scenario", default=",".join(SCENARIOS))
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--members", type=int, default=200, help="members per guild (half of them linked)")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake REST latency (s)")
+    parser.add_argument("--role-limit", default="10/1", help="role edits per guild, N/seconds or 'none'")
+    parser.add_argument("--global-limit", default="50/1", help="all REST calls, N/seconds or 'none'")
+    parser.add_argument("--raise-429", action="store_true", help="raise HTTPException(429) instead of waiting")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--new-links", type=int, default=20, help="per guild (link scenario)")
+    parser.add_argument("--drift", type=int, default=20, help="members per guild with drifted roles (reconcile)")
+    parser.add_argument("--command-users", type=int, default=100)
+    parser.add_argument("--db", default="")
+    parser.add_argument("--json", default="", help="write results to this file")
+    args = parser.parse_args()
+
+    unknown = set(args.scenario.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+# bench/fake_discord.py
+# Faux Discord en mémoire pour les benchs : guildes, membres, rôles, salons, interactions.
+# Chaque appel "REST" attend `latency` secondes et passe par des buckets de rate limit : au-delà de la
+# limite, l'appel compte un 429 puis attend retry_after et réessaie (comme le client HTTP de discord.py),
+# ou lève discord.HTTPException(429) si raise_on_429=True.
+#
+#   bot = FakeBot(guilds=3, members_per_guild=1000, latency=0.05, role_limit=(10, 10.0))
+#   api.set_discord_bot(bot); bridge.set_bot(bot); member_cache / reconciler / join_batcher : idem
+#   tree = command_tree(); setup_commands(tree)
+#   inter = bot.interaction(guild, user_id)
+#   await invoke(tree, "profile", inter, pseudo="player1")
+#   await click(inter.view, "next", bot.interaction(guild, user_id))
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import Optional
+
+import discord
+from discord import app_commands
+
+_ids = itertools.count(1)
+
+
+def _http_error(status: int, reason: str, message: str = ""):
+    response = SimpleNamespace(status=status, reason=reason)
+    if status == 404:
+        return discord.NotFound(response, message)
+    if status == 403:
+        return discord.Forbidden(response, message)
+    return discord.HTTPException(response, message)
+
+
+class RateLimit:
+    """Sliding window: `limit` calls per `per` seconds for one bucket."""
+
+    def __init__(self, limit: int, per: float):
+        self.limit = limit
+        self.per = per
+        self._calls: deque = deque()
+
+    def retry_after(self) -> float:
+        now = time.monotonic()
+        while self._calls and now - self._calls[0] >= self.per:
+            self._calls.popleft()
+        if len(self._calls) < self.limit:
+            self._calls.append(now)
+            return 0.0
+        return self.per - (now - self._calls[0])
+
+
+class FakeREST:
+    """Latency + rate limits + counters shared by every fake object of one FakeBot."""
+
+    def __init__(self, latency: float = 0.05, role_limit: Optional[tuple] = (10, 10.0),
+                 global_limit: Optional[tuple] = (50, 1.0), raise_on_429: bool = False):
+        self.latency = latency
+        self.role_limit = role_limit
+        self.global_limit = RateLimit(*global_limit) if global_limit else None
+        self.raise_on_429 = raise_on_429
+        self._buckets: dict = {}
+        self.calls: dict = {}        # route -> n
+        self.rate_limited: dict = {}  # route -> n de 429
+        self.retry_wait = 0.0         # secondes passées à attendre des 429
+
+    def _bucket(self, route: str, major: int) -> Optional[RateLimit]:
+        if not route.startswith("role") or not self.role_limit:
+            return None
+        key = ("role", major)  # bucket par guilde, comme PUT/DELETE .../members/{id}/roles/{id}
+        if key not in self._buckets:
+            self._buckets[key] = RateLimit(*self.role_limit)
+        return self._buckets[key]
+
+    async def call(self, route: str, major: int = 0):
+        self.calls[route] = self.calls.get(route, 0) + 1
+        bucket = self._bucket(route, major)
+        global_limit = None if route.startswith("interaction") else self.global_limit  # réponses hors limite globale
+        while True:
+            wait = max(
+                bucket.retry_after() if bucket else 0.0,
+                global_limit.retry_after() if global_limit else 0.0,
+            )
+            if not wait:
+                break
+            self.rate_limited[route] = self.rate_limited.get(route, 0) + 1
+            if self.raise_on_429:
+                raise _http_error(429, "Too Many Requests", f"retry_after={wait:.3f}")
+            self.retry_wait += wait
+            await asyncio.sleep(wait)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def stats(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "rate_limited": dict(self.rate_limited),
+            "retry_wait_s": round(self.retry_wait, 2),
+        }
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+    def __repr__(self):
+        return f"<FakeRole {self.name} {self.id}>"
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: Optional[str] = None):
+        self.id = user_id
+        self.name = name or f"user{user_id}"
+        self.display_name = self.name
+        self.bot = False
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return self.name
+
+
+class FakeMember(FakeUser):
+    def __init__(self, user_id: int, guild: "FakeGuild", roles=()):
+        super().__init__(user_id)
+        self.guild = guild
+        self.roles = list(roles)
+
+    def get_role(self, role_id: int):
+        return next((r for r in self.roles if r.id == int(role_id)), None)
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.guild._rest.call("role_add", self.guild.id)
+            if role not in self.roles:
+                self.roles.append(role)
+
+    async def remove_roles(self, *roles, reason=None):
+        for role in roles:
+            await self.guild._rest.call("role_remove", self.guild.id)
+            if role in self.roles:
+                self.roles.remove(role)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, rest: FakeREST):
+        self.id = channel_id
+        self.sent: deque = deque(maxlen=20)  # (contenu, nb d'embeds) : rien de retenu côté faux Discord
+        self.sent_count = 0
+        self._rest = rest
+
+    async def send(self, content=None, **kwargs):
+        await self._rest.call("channel_send", self.id)
+        self.sent_count += 1
+        self.sent.append((content, len(kwargs.get("embeds") or ()) + (1 if kwargs.get("embed") else 0)))
+        return SimpleNamespace(id=next(_ids), channel=self, content=content)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, rest: FakeREST, members: int = 0, cache_members: bool = False):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.shard_id = 0
+        self._rest = rest
+        self._cache_members = cache_members  # False = MemberCacheFlags.none() (get_member -> None)
+        self.roles = {
+            key: FakeRole(guild_id + i, key)
+            for i, key in enumerate(("linked", "vip", "beta", "admin"), start=1)
+        }
+        self.channels = {key: guild_id + i for i, key in enumerate(("announce", "admin_log", "store_log"), start=11)}
+        self._members: dict = {}
+        for n in range(members):
+            self.add_member(guild_id * 1000 + n)
+
+    @property
+    def member_count(self) -> int:
+        return len(self._members)
+
+    def add_member(self, user_id: int, roles=()) -> FakeMember:
+        member = FakeMember(int(user_id), self, roles)
+        self._members[int(user_id)] = member
+        return member
+
+    def remove_member(self, user_id: int):
+        self._members.pop(int(user_id), None)
+
+    def get_role(self, role_id: int):
+        return next((r for r in self.roles.values() if r.id == int(role_id)), None)
+
+    def get_member(self, user_id: int):
+        return self._members.get(int(user_id)) if self._cache_members else None
+
+    async def fetch_member(self, user_id: int):
+        await self._rest.call("fetch_member", self.id)
+        member = self._members.get(int(user_id))
+        if member is None:
+            raise _http_error(404, "Not Found", "Unknown Member")
+        return member
+
+    async def query_members(self, query=None, *, limit=5, user_ids=None, presences=False, cache=True):
+        await self._rest.call("query_members", self.id)  # gateway, pas REST, mais même latence
+        if user_ids is not None:
+            return [self._members[int(u)] for u in user_ids if int(u) in self._members][:limit]
+        return [m for m in self._members.values() if m.name.startswith(query or "")][:limit]
+
+    async def fetch_members(self, *, limit=1000, after=None):
+        members = list(self._members.values())
+        for i in range(0, len(members), 1000):  # pages de 1000, un appel REST chacune
+            await self._rest.call("fetch_members", self.id)
+            for member in members[i:i + 1000]:
+                yield member
+
+
+class FakeHTTP:
+    """`bot.http` subset used by reconcile.py (role edits by id)."""
+
+    def __init__(self, bot: "FakeBot"):
+        self._bot = bot
+
+    async def add_role(self, guild_id, user_id, role_id, *, reason=None):
+        guild = self._bot.get_guild(guild_id)
+        await self._bot.rest.call("role_add", int(guild_id))
+        member = guild._members.get(int(user_id)) if guild else None
+        role = guild.get_role(role_id) if guild else None
+        if member is None or role is None:
+            raise _http_error(404, "Not Found", "Unknown Member")
+        if role not in member.roles:
+            member.roles.append(role)
+
+    async def remove_role(self, guild_id, user_id, role_id, *, reason=None):
+        guild = self._bot.get_guild(guild_id)
+        await self._bot.rest.call("role_remove", int(guild_id))
+        member = guild._members.get(int(user_id)) if guild else None
+        role = guild.get_role(role_id) if guild else None
+        if member is not None and role in member.roles:
+            member.roles.remove(role)
+
+
+# ===== Interactions =====
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _respond(self, kind: str, content=None, **kwargs):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)  # vraie erreur : 2e réponse
+        self._done = True
+        await self._interaction._record(kind, content, **kwargs)
+
+    async def send_message(self, content=None, **kwargs):
+        await self._respond("send_message", content, **kwargs)
+
+    async def defer(self, **kwargs):
+        await self._respond("defer")
+
+    async def edit_message(self, content=None, **kwargs):
+        await self._respond("edit_message", content, **kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        if not self._interaction.response.is_done():
+            raise _http_error(404, "Not Found", "Unknown Webhook")  # followup avant réponse
+        await self._interaction._record("followup", content, **kwargs)
+
+
+class FakeInteraction:
+    def __init__(self, bot: "FakeBot", guild: Optional[FakeGuild], user):
+        self.id = next(_ids)
+        self.client = bot
+        self.guild = guild
+        self.guild_id = guild.id if guild else None
+        self.user = user
+        self.created_at = time.monotonic()
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.messages: list = []  # (kind, content, embed, ephemeral)
+        self.view = None          # dernière vue envoyée (pour click / select)
+        self.first_response_ms: Optional[float] = None
+
+    async def _record(self, kind: str, content=None, **kwargs):
+        await self.client.rest.call(f"interaction_{kind}", self.id)
+        if self.first_response_ms is None:
+            self.first_response_ms = (time.monotonic() - self.created_at) * 1000
+        if kwargs.get("view") is not None:
+            self.view = kwargs["view"]
+            self.client.store_view(self.view)
+        self.messages.append((kind, content, kwargs.get("embed"), kwargs.get("ephemeral", False)))
+
+    @property
+    def text(self) -> str:
+        return "\n".join(str(c) for _, c, _, _ in self.messages if c)
+
+
+class FakeBot:
+    """Stands in for the discord.py bot wherever the code takes one (api, bridge, reconciler)."""
+
+    def __init__(self, guilds: int = 3, members_per_guild: int = 0, latency: float = 0.05,
+                 role_limit: Optional[tuple] = (10, 10.0), global_limit: Optional[tuple] = (50, 1.0),
+                 raise_on_429: bool = False, cache_members: bool = False, view_ttl: Optional[float] = None):
+        self.rest = FakeREST(latency, role_limit, global_limit, raise_on_429)
+        self.view_ttl = view_ttl  # None = view.timeout, comme le ViewStore de discord.py
+        self._views: list = []  # tas (expires_at, n, view) : vues référencées jusqu'à leur timeout
+        self._persistent_views: list = []  # timeout=None : gardées pour toujours par le ViewStore
+        self._view_seq = itertools.count()
+        self.http = FakeHTTP(self)
+        self.user = FakeUser(1, "slfo-bot")
+        self.guilds = [FakeGuild((g + 1) * 10**6, self.rest, members_per_guild, cache_members) for g in range(guilds)]
+        self._guilds = {g.id: g for g in self.guilds}
+        self._channels: dict = {}
+        self._users: dict = {}
+
+    def get_guild(self, guild_id: int):
+        return self._guilds.get(int(guild_id))
+
+    def get_channel(self, channel_id: int):
+        cid = int(channel_id)
+        if cid not in self._channels:
+            self._channels[cid] = FakeChannel(cid, self.rest)
+        return self._channels[cid]
+
+    async def fetch_channel(self, channel_id: int):
+        await self.rest.call("fetch_channel", int(channel_id))
+        return self.get_channel(channel_id)
+
+    def get_user(self, user_id: int):
+        return self._users.get(int(user_id))
+
+    async def wait_until_ready(self):
+        return None
+
+    def interaction(self, guild: Optional[FakeGuild], user_id: int, member: bool = True) -> FakeInteraction:
+        """Interaction from `user_id`; a guild member (added if needed) unless member=False."""
+        user = None
+        if guild is not None and member:
+            user = guild._members.get(int(user_id)) or guild.add_member(int(user_id))
+        return FakeInteraction(self, guild, user or FakeUser(int(user_id)))
+
+    def store_view(self, view: discord.ui.View):
+        now = time.monotonic()
+        # tas : les timeouts mélangés (120 s, 180 s...) expirent dans l'ordre de leur échéance
+        while self._views and self._views[0][0] <= now:
+            _, _, expired = heapq.heappop(self._views)
+            expired.stop()
+        if view.timeout is None:
+            # jamais expirée : c'est exactement la fuite qu'un soak doit voir (--view-ttl ne s'applique pas)
+            self._persistent_views.append(view)
+            return
+        ttl = self.view_ttl if self.view_ttl is not None else view.timeout
+        heapq.heappush(self._views, (now + ttl, next(self._view_seq), view))
+
+    @property
+    def live_views(self) -> int:
+        return len(self._views) + len(self._persistent_views)
+
+    def channel_messages(self) -> int:
+        return sum(c.sent_count for c in self._channels.values())
+
+
+# ===== Exécution des commandes / composants =====
+
+def command_tree() -> app_commands.CommandTree:
+    """A CommandTree bound to an unconnected client, for setup_commands()."""
+    return app_commands.CommandTree(discord.Client(intents=discord.Intents.none()))
+
+
+async def invoke(tree: app_commands.CommandTree, name: str, interaction: FakeInteraction, **params):
+    """Run a slash command's checks and callback like the tree would; errors go to tree.on_error."""
+    command = tree.get_command(name)
+    if command is None:
+        raise KeyError(name)
+    try:
+        for check in command.checks:
+            if not await discord.utils.maybe_coroutine(check, interaction):
+                raise app_commands.CheckFailure(f"check failed for {name}")
+        await command.callback(interaction, **params)
+    except app_commands.AppCommandError as e:
+        await tree.on_error(interaction, e)
+
+
+async def click(view: discord.ui.View, button: str, interaction: FakeInteraction):
+    """Press a decorated button (attribute name) of a view sent earlier."""
+    if await view.interaction_check(interaction):
+        await getattr(view, button).callback(interaction)
+
+
+async def select(view: discord.ui.View, value: str, interaction: FakeInteraction):
+    """Pick `value` in the view's first Select."""
+    from discord.ui.select import selected_values
+
+    item = next(c for c in view.children if isinstance(c, discord.ui.Select))
+    if await view.interaction_check(interaction):
+        token = selected_values.set({item.custom_id: [value]})
+        try:
+            await item.callback(interaction)
+        finally:
+            selected_values.reset(token)
@@ -0,0 +1,136 @@
+# bench/join_burst_bench.py
+# Rafale synthétique de on_member_join : ancien chemin (2 connexions SQLite + add_roles par join)
+# vs join_batcher. Mesure join -> rôle posé et les requêtes DB.
+#
+#   python bench/join_burst_bench.py --joins 500 --linked-ratio 0.3
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosqlite
+
+import db
+from join_batcher import JoinBatcher, _percentile
+
+GUILD_ID = 4242
+ROLE_ID = 777
+
+
+class FakeRole:
+    def __init__(self, role_id: int):
+        self.id = role_id
+
+
+class FakeGuild:
+    def __init__(self):
+        self.id = GUILD_ID
+        self.role = FakeRole(ROLE_ID)
+
+    def get_role(self, role_id: int):
+        return self.role if int(role_id) == ROLE_ID else None
+
+
+class FakeMember:
+    def __init__(self, user_id: int, guild: FakeGuild, api_latency: float, done: dict):
+        self.id = user_id
+        self.guild = guild
+        self.roles = []
+        self._api_latency = api_latency
+        self._done = done
+
+    async def add_roles(self, *roles, reason=None):
+        await asyncio.sleep(self._api_latency)
+        self.roles.extend(roles)
+        self._done[self.id] = time.monotonic()
+
+
+async def legacy_join(member: FakeMember):
+    # ancien on_member_join
+    link = await db.get_link_by_discord(member.id)
+    if not link:
+        return
+    settings = await db._load_guild_settings(int(member.guild.id))
+    role = member.guild.get_role(int(settings["linked_role_id"]))
+    if role is not None and role not in member.roles:
+        await member.add_roles(role)
+
+
+def report(name: str, joined: dict, done: dict, elapsed: float, queries: int):
+    lat = [(done[uid] - joined[uid]) * 1000 for uid in done]
+    print(
+        f"  {name:8s} roles={len(done):5d} wall={elapsed:6.2f}s db_queries={queries:5d} "
+        f"join->role p50={_percentile(lat, 0.5) or 0:8.1f}ms p95={_percentile(lat, 0.95) or 0:8.1f}ms "
+        f"max={max(lat) if lat else 0:8.1f}ms"
+    )
+
+
+def count_queries():
+    counter = {"n": 0}
+    real_connect = aiosqlite.connect
+
+    def connect(*a, **kw):
+        counter["n"] += 1
+        return real_connect(*a, **kw)
+
+    aiosqlite.connect = connect
+    return counter, lambda: setattr(aiosqlite, "connect", real_connect)
+
+
+async def run(args):
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+    await db.init_db()
+    await db.upsert_guild_settings(GUILD_ID, linked_role_id=ROLE_ID)
+
+    random.seed(1)
+    ids = random.sample(range(10**17, 10**18), args.joins)
+    linked = ids[: int(len(ids) * args.linked_ratio)]
+    for i, uid in enumerate(linked):
+        await db.store_link(uid, 1000 + i, f"user{i}")
+
+    print(f"{args.joins} joins in a burst, {len(linked)} linked, role API latency {args.api_latency * 1000:.0f}ms")
+    guild = FakeGuild()
+
+    # ancien chemin : une tâche par event, comme le dispatch discord.py
+    done, joined = {}, {}
+    members = [FakeMember(uid, guild, args.api_latency, done) for uid in ids]
+    counter, restore = count_queries()
+    started = time.monotonic()
+    for m in members:
+        joined[m.id] = time.monotonic()
+    await asyncio.gather(*(legacy_join(m) for m in members))
+    restore()
+    report("legacy", joined, done, time.monotonic() - started, counter["n"])
+
+    # batcher (pas de pré-filtre is_linked ici : toute la rafale passe par la DB)
+    done, joined = {}, {}
+    members = [FakeMember(uid, guild, args.api_latency, done) for uid in ids]
+    batcher = JoinBatcher(rate=args.rate)
+    db.GUILD_SETTINGS_CACHE.clear()
+    counter, restore = count_queries()
+    started = time.monotonic()
+    for m in members:
+        joined[m.id] = time.monotonic()
+        batcher.submit(m)
+    await batcher.drain()
+    restore()
+    report("batched", joined, done, time.monotonic() - started, counter["n"])
+    print("  batcher stats:", batcher.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--joins", type=int, default=500)
+    parser.add_argument("--linked-ratio", type=float, default=0.3)
+    parser.add_argument("--api-latency", type=float, default=0.05, help="simulated add_roles latency (s)")
+    parser.add_argument("--rate", type=float, default=50.0, help="batcher role edits per second")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
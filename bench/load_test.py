@@ -0,0 +1,307 @@
+# bench/load_test.py
+# Charge HTTP de bout en bout : N serveurs Roblox simulés contre l'API FastAPI,
+# en process (httpx + ASGITransport, faux bot Discord) ou sur une instance lancée (--url).
+#
+# Chaque serveur simulé :
+#   - /profile/update pour chacun de ses joueurs toutes les ~60s
+#   - /admin/actions/pull toutes les ~5s, puis ack + report des actions de ses joueurs
+#   - /leaderboard/update (points/kills/robux) toutes les ~30s
+#   - /link/confirm de temps en temps (codes créés directement en DB : en process, ou --db)
+# --speed compresse le temps (cadences divisées d'autant).
+#
+#   python bench/load_test.py --servers 50 --players 20 --duration 60 --speed 10 --save
+#   python bench/load_test.py --url http://127.0.0.1:8000 --api-key ... --db links.db --compare bench/results/xxx.json
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+from fake_discord import FakeBot
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+PROFILE_INTERVAL = 60.0
+ADMIN_PULL_INTERVAL = 5.0
+LEADERBOARD_INTERVAL = 30.0
+LINK_CONFIRM_INTERVAL = 120.0
+ADMIN_ENQUEUE_PER_SECOND = 2.0  # actions admin/store injectées (toutes parties confondues)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict = {}  # endpoint -> [ms]
+        self.errors: dict = {}     # endpoint -> {status: n}
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+            status = resp.status_code
+        except httpx.HTTPError as e:
+            resp, status = None, type(e).__name__
+        self.latencies.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+        if resp is None or resp.status_code >= 400:
+            errs = self.errors.setdefault(name, {})
+            errs[str(status)] = errs.get(str(status), 0) + 1
+        return resp
+
+
+# ===== Simulation =====
+
+async def _every(interval: float, stop_at: float, fn, jitter: bool = True):
+    if jitter:
+        await asyncio.sleep(min(random.uniform(0, interval), max(0.0, stop_at - time.monotonic())))
+    while time.monotonic() < stop_at:
+        started = time.monotonic()
+        await fn()
+        next_at = min(started + interval, stop_at)  # ne pas dormir au-delà de la fin du test
+        await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+
+async def game_server(idx: int, client, rec: Recorder, args, stop_at: float, db_mod, id_gen):
+    headers = {"x-api-key": args.api_key}
+    server_id = f"job-{idx:04d}"
+    players = [(1_000_000 + idx * 1000 + p, f"player{idx}_{p}") for p in range(args.players)]
+    mine = {rid for rid, _ in players}
+    speed = args.speed
+
+    async def profile_one(rid, name):
+        body = {
+            "roblox_user_id": rid, "roblox_username": name,
+            "points": random.randint(0, 10**6), "bank": random.randint(0, 10**5),
+            "tickets": random.randint(0, 50), "kills": random.randint(0, 5000),
+            "robux_donated": random.randint(0, 1000),
+            "swords": {f"sword{i}": random.randint(1, 3) for i in range(8)},
+            "vip": rid % 7 == 0, "beta": rid % 11 == 0,
+        }
+        await rec.call(client, "profile_update", "POST", "/profile/update", json=body, headers=headers)
+
+    async def admin_loop():
+        resp = await rec.call(client, "admin_pull", "GET", "/admin/actions/pull", params={"limit": 50}, headers=headers)
+        if resp is None or resp.status_code != 200:
+            return
+        actions = [a for a in resp.json().get("actions", []) if a["roblox_user_id"] in mine]
+        if not actions:
+            return
+        await rec.call(client, "admin_ack", "POST", "/admin/actions/ack", json={"ids": [a["id"] for a in actions]}, headers=headers)
+        for a in actions:
+            await rec.call(client, "admin_report", "POST", "/admin/actions/report", headers=headers, json={
+                "action_id": a["id"], "success": True, "result_text": "ok",
+                "roblox_user_id": a["roblox_user_id"], "roblox_username": f"player{a['roblox_user_id']}",
+                "action": a["action"], "amount": a["amount"],
+            })
+
+    async def leaderboard_loop():
+        for key in ("points", "kills", "robux"):
+            entries = [{"user_id": rid, "username": name, "value": random.randint(0, 10**6)} for rid, name in players[:10]]
+            await rec.call(client, "leaderboard_update", "POST", "/leaderboard/update", headers=headers,
+                           json={"key": key, "entries": entries, "server_id": server_id})
+
+    async def link_loop():
+        discord_id, roblox_id = next(id_gen)
+        code = f"L{discord_id:x}".upper()[:12]
+        await db_mod.store_code(code, discord_id)
+        await rec.call(client, "link_confirm", "POST", "/link/confirm", headers=headers,
+                       json={"code": code, "roblox_user_id": roblox_id, "roblox_username": f"new{roblox_id}"})
+
+    tasks = [
+        *(_every(PROFILE_INTERVAL / speed, stop_at, lambda r=rid, n=name: profile_one(r, n)) for rid, name in players),
+        _every(ADMIN_PULL_INTERVAL / speed, stop_at, admin_loop),
+        _every(LEADERBOARD_INTERVAL / speed, stop_at, leaderboard_loop),
+    ]
+    if db_mod is not None:
+        tasks.append(_every(LINK_CONFIRM_INTERVAL / speed, stop_at, link_loop))
+    await asyncio.gather(*tasks)
+
+
+async def admin_feeder(args, stop_at: float, db_mod):
+    # actions à consommer par les pulls (joueurs pris au hasard parmi les serveurs simulés)
+    async def enqueue():
+        server = random.randrange(args.servers)
+        rid = 1_000_000 + server * 1000 + random.randrange(args.players)
+        await db_mod.enqueue_admin_action(rid, random.choice(["BANK_ADD", "HAND_REMOVE", "TICKETS_ADD"]), random.randint(1, 100))
+    await _every(1.0 / (ADMIN_ENQUEUE_PER_SECOND * args.speed), stop_at, enqueue, jitter=False)
+
+
+_METRIC_RE = re.compile(r"^(slfo_db_lock_wait_seconds_(?:sum|count)|slfo_db_lock_errors_total|slfo_event_loop_stalls_total) ([0-9.eE+-]+)$", re.M)
+
+
+async def read_lock_metrics(client, args) -> dict:
+    headers = {"x-metrics-token": args.metrics_token} if args.metrics_token else {}
+    try:
+        resp = await client.get("/metrics", headers=headers)
+    except httpx.HTTPError:
+        return {}
+    return {name: float(value) for name, value in _METRIC_RE.findall(resp.text)} if resp.status_code == 200 else {}
+
+
+def summarize(rec: Recorder, elapsed: float, before: dict, after: dict, args) -> dict:
+    endpoints = {}
+    total = 0
+    for name, lat in sorted(rec.latencies.items()):
+        total += len(lat)
+        endpoints[name] = {
+            "requests": len(lat),
+            "rps": round(len(lat) / elapsed, 1),
+            "p50_ms": round(percentile(lat, 0.50), 2),
+            "p95_ms": round(percentile(lat, 0.95), 2),
+            "p99_ms": round(percentile(lat, 0.99), 2),
+            "errors": rec.errors.get(name, {}),
+        }
+
+    def delta(key):
+        return after.get(key, 0.0) - before.get(key, 0.0)
+
+    waits = delta("slfo_db_lock_wait_seconds_count")
+    return {
+        "at": int(time.time()),
+        "config": {k: getattr(args, k) for k in ("servers", "players", "duration", "speed", "url")},
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "rps": round(total / elapsed, 1),
+        "endpoints": endpoints,
+        "sqlite": {
+            "write_transactions": int(waits),
+            "lock_wait_avg_ms": round(delta("slfo_db_lock_wait_seconds_sum") / waits * 1000, 3) if waits else 0.0,
+            "lock_errors": int(delta("slfo_db_lock_errors_total")),
+        },
+        "loop_stalls": int(delta("slfo_event_loop_stalls_total")),
+    }
+
+
+def print_summary(s: dict):
+    print(f"\n{s['requests']} requests in {s['elapsed_s']}s -> {s['rps']} req/s")
+    print(f"{'endpoint':20s} {'reqs':>7s} {'rps':>7s} {'p50':>8s} {'p95':>8s} {'p99':>8s}  errors")
+    for name, e in s["endpoints"].items():
+        print(f"{name:20s} {e['requests']:7d} {e['rps']:7.1f} {e['p50_ms']:8.1f} {e['p95_ms']:8.1f} {e['p99_ms']:8.1f}  {e['errors'] or ''}")
+    sq = s["sqlite"]
+    print(f"sqlite: {sq['write_transactions']} write transactions, lock wait avg {sq['lock_wait_avg_ms']}ms, "
+          f"{sq['lock_errors']} 'database is locked' errors; loop stalls: {s['loop_stalls']}")
+
+
+def compare(s: dict, baseline_path: str, max_regression: float) -> bool:
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)
+    print(f"\nvs {baseline_path}:")
+    ok = True
+    print(f"  throughput {base['rps']} -> {s['rps']} req/s")
+    for name, e in s["endpoints"].items():
+        b = base["endpoints"].get(name)
+        if not b or not b["p95_ms"]:
+            continue
+        change = (e["p95_ms"] - b["p95_ms"]) / b["p95_ms"] * 100
+        flag = ""
+        if max_regression is not None and change > max_regression:
+            flag, ok = "  REGRESSION", False
+        print(f"  {name:20s} p95 {b['p95_ms']:8.1f} -> {e['p95_ms']:8.1f} ms ({change:+.0f}%){flag}")
+    return ok
+
+
+async def run(args) -> dict:
+    db_mod = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+        if args.db:
+            import db as db_mod
+            db_mod.DB_PATH = args.db
+    else:
+        import db as db_mod
+        db_mod.DB_PATH = args.db or os.path.join(tempfile.mkdtemp(), "load.db")
+        import api
+        from bot_api import bridge
+        from config import ROBLOX_API_KEY
+
+        await db_mod.init_db()
+        bot = FakeBot(latency=args.discord_latency, role_limit=None, global_limit=None)
+        api.set_discord_bot(bot)
+        bridge.set_bot(bot)
+        for g in bot.guilds:
+            await db_mod.upsert_guild_settings(
+                g.id, linked_role_id=g.roles["linked"].id, vip_role_id=g.roles["vip"].id,
+                beta_role_id=g.roles["beta"].id, announce_channel_id=g.channels["announce"],
+                admin_log_channel_id=g.channels["admin_log"],
+            )
+        # une partie des joueurs est linkée (rôles à synchroniser) et présente sur les serveurs Discord
+        for s in range(args.servers):
+            for p in range(0, args.players, 3):
+                rid = 1_000_000 + s * 1000 + p
+                await db_mod.store_link(10**15 + rid, rid, f"player{s}_{p}")
+                for g in bot.guilds:
+                    g.add_member(10**15 + rid)
+        args.api_key = args.api_key or ROBLOX_API_KEY
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://slfo", timeout=30)
+
+    def ids():
+        n = 0
+        while True:
+            n += 1
+            yield 9 * 10**16 + int(time.time()) * 1000 + n, 5_000_000 + int(time.time()) % 100_000 * 100 + n
+
+    rec = Recorder()
+    before = await read_lock_metrics(client, args)
+    started = time.monotonic()
+    stop_at = started + args.duration
+    id_gen = ids()
+
+    jobs = [game_server(i, client, rec, args, stop_at, db_mod, id_gen) for i in range(args.servers)]
+    if db_mod is not None:
+        jobs.append(admin_feeder(args, stop_at, db_mod))
+    print(f"{args.servers} servers x {args.players} players for {args.duration}s (speed x{args.speed}) "
+          f"{'against ' + args.url if args.url else 'in-process'}")
+    await asyncio.gather(*jobs)
+
+    elapsed = time.monotonic() - started
+    after = await read_lock_metrics(client, args)
+    await client.aclose()
+    return summarize(rec, elapsed, before, after, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SLFO API load test (simulated Roblox servers)")
+    parser.add_argument("--servers", type=int, default=20)
+    parser.add_argument("--players", type=int, default=20, help="players per server")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression of the cadences")
+    parser.add_argument("--url", default="", help="running API; default: in-process app")
+    parser.add_argument("--api-key", default="")
+    parser.add_argument("--metrics-token", default=os.getenv("SLFO_METRICS_TOKEN", ""))
+    parser.add_argument("--db", default="", help="SQLite file (codes/actions seeding with --url)")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="fake bot REST latency (s)")
+    parser.add_argument("--save", action="store_true", help=f"write results to {RESULTS_DIR}")
+    parser.add_argument("--compare", default="", help="previous results JSON to compare p95 with")
+    parser.add_argument("--max-regression", type=float, default=None, help="fail if a p95 grows more than this %%")
+    args = parser.parse_args()
+
+    summary = asyncio.run(run(args))
+    print_summary(summary)
+
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"load_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"saved {path}")
+
+    if args.compare and not compare(summary, args.compare, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench/member_cache_bench.py
+# Mémoire du cache de membres : cache discord.py par défaut (tous les membres après chunk)
+# vs LinkedMemberCache (seulement les membres linkés).
+#
+#   python bench/member_cache_bench.py --guilds 20 --members 20000 --linked 2000
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+
+from member_cache import LinkedMemberCache
+
+
+def make_state():
+    client = discord.Client(intents=discord.Intents.default())
+    return client._connection
+
+
+def make_guild(state, guild_id: int, roles: int = 10) -> discord.Guild:
+    data = {
+        "id": str(guild_id),
+        "name": f"guild-{guild_id}",
+        "owner_id": "1",
+        "roles": [
+            {"id": str(guild_id + r), "name": f"role-{r}", "permissions": "0", "position": r}
+            for r in range(roles)
+        ],
+        "emojis": [],
+        "features": [],
+        "member_count": 0,
+    }
+    return discord.Guild(data=data, state=state)
+
+
+def member_data(user_id: int, role_ids: list) -> dict:
+    return {
+        "user": {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "avatar": None, "global_name": None},
+        "roles": [str(r) for r in role_ids],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def populate(guilds, members: int, linked: set, mode: str, state):
+    cache = LinkedMemberCache()
+    cache.load([(uid, 0, "", 0) for uid in linked])
+
+    for guild in guilds:
+        role_ids = [r.id for r in guild.roles[1:]]
+        for uid in range(1, members + 1):
+            if mode == "linked" and uid not in linked:
+                continue  # jamais matérialisé : ni chunk, ni query
+            member = discord.Member(data=member_data(uid, random.sample(role_ids, 2)), guild=guild, state=state)
+            if mode == "default":
+                guild._add_member(member)
+            else:
+                cache.put(member)
+    return cache
+
+
+def measure(mode: str, args) -> tuple[int, int]:
+    random.seed(1)
+    state = make_state()
+    linked = set(random.sample(range(1, args.members + 1), args.linked))
+
+    tracemalloc.start()
+    guilds = [make_guild(state, (g + 1) << 32) for g in range(args.guilds)]
+    base, _ = tracemalloc.get_traced_memory()
+    keep = populate(guilds, args.members, linked, mode, state)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    held = sum(len(g._members) for g in guilds) if mode == "default" else keep.stats()["members"]
+    return current - base, held
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--members", type=int, default=20_000, help="members per guild")
+    parser.add_argument("--linked", type=int, default=1_000, help="linked users (present in every guild)")
+    args = parser.parse_args()
+
+    print(f"{args.guilds} guilds x {args.members} members, {args.linked} linked")
+    results = {}
+    for mode in ("default", "linked"):
+        size, held = measure(mode, args)
+        results[mode] = size
+        print(f"  {mode:8s} {held:>9d} members cached  {size / 1024 / 1024:8.1f} MiB")
+    print(f"  ratio    {results['default'] / max(1, results['linked']):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
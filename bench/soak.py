@@ -0,0 +1,261 @@
+# bench/soak.py
+# Soak test : commandes slash synthétiques (vues comprises) + trafic API en process, pendant des heures,
+# contre le faux Discord (bench/fake_discord.py). Instantanés périodiques tracemalloc + RSS ; échec si la
+# mémoire continue de croître une fois le régime établi (pente de régression linéaire > seuil).
+#
+#   python bench/soak.py --duration 14400 --interval 60 --rate 5      # 4 h
+#   python bench/soak.py --duration 300 --interval 10 --warmup 60 --view-ttl 30   # contrôle rapide
+#
+# --warmup doit dépasser le plus long timeout de vue (180 s, ou --view-ttl) : avant, les vues encore
+# référencées s'accumulent sans être une fuite.
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SLFO_TRACE_FILE", "")
+
+import httpx
+
+from discord_bench import build_env, user_session
+
+_CODE_RE = re.compile(r":link (\w+)")
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource  # pas de /proc : pic RSS seulement (ko sous Linux, octets sous macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def slope_per_hour(points: list) -> float:
+    """Least-squares slope of [(seconds, bytes)] in bytes/hour."""
+    n = len(points)
+    if n < 3:
+        return 0.0
+    mx = sum(x for x, _ in points) / n
+    my = sum(y for _, y in points) / n
+    var = sum((x - mx) ** 2 for x, _ in points)
+    if not var:
+        return 0.0
+    return sum((x - mx) * (y - my) for x, y in points) / var * 3600
+
+
+class Soak:
+    def __init__(self, env, client: httpx.AsyncClient, args):
+        self.env = env
+        self.client = client
+        self.args = args
+        self.headers = {"x-api-key": args.api_key}
+        self.counts = {"sessions": 0, "api_requests": 0, "api_errors": 0, "session_errors": 0}
+
+    async def api(self, method: str, url: str, **kwargs):
+        self.counts["api_requests"] += 1
+        resp = await self.client.request(method, url, headers=self.headers, **kwargs)
+        if resp.status_code >= 400:
+            self.counts["api_errors"] += 1
+        return resp
+
+    async def session(self):
+        """Slash commands for a random linked user, then relink through /link/confirm and sync the profile."""
+        guild, discord_id, roblox_id = random.choice(self.env.linked)
+        try:
+            last = await user_session(self.env, guild, discord_id, {})
+            m = _CODE_RE.search(last.text) if last is not None else None
+            if m:
+                await self.api("POST", "/link/confirm", json={
+                    "code": m.group(1), "roblox_user_id": roblox_id, "roblox_username": f"player{roblox_id}",
+                })
+            await self.api("POST", "/profile/update", json={
+                "roblox_user_id": roblox_id, "roblox_username": f"player{roblox_id}",
+                "points": random.randint(0, 3_000_000), "bank": random.randint(0, 10**5), "tickets": 1,
+                "kills": random.randint(0, 5000), "robux_donated": 0,
+                "swords": {f"Sword {i}": 1 for i in range(random.randint(0, 40))},
+                "vip": random.random() < 0.2, "beta": random.random() < 0.1,
+            })
+        except Exception as e:
+            self.counts["session_errors"] += 1
+            print("[Soak] session failed:", repr(e))
+        finally:
+            self.counts["sessions"] += 1
+
+    async def game_server_tick(self, server: int):
+        """One simulated Roblox server: leaderboard push + admin queue pull/ack/report."""
+        players = random.sample(self.env.linked, min(10, len(self.env.linked)))
+        for key in ("points", "kills", "robux"):
+            await self.api("POST", "/leaderboard/update", json={
+                "key": key, "server_id": f"soak-{server}",
+                "entries": [{"user_id": rid, "username": f"player{rid}", "value": random.randint(0, 10**6)} for _, _, rid in players],
+            })
+        resp = await self.api("GET", "/admin/actions/pull", params={"limit": 50})
+        actions = resp.json().get("actions", []) if resp.status_code == 200 else []
+        if actions:
+            await self.api("POST", "/admin/actions/ack", json={"ids": [a["id"] for a in actions]})
+            for a in actions:
+                await self.api("POST", "/admin/actions/report", json={
+                    "action_id": a["id"], "success": True, "result_text": "ok", "roblox_user_id": a["roblox_user_id"],
+                    "roblox_username": f"player{a['roblox_user_id']}", "action": a["action"], "amount": a["amount"],
+                })
+
+    async def traffic(self, stop_at: float):
+        in_flight: set = set()
+        tick = 0
+        while time.monotonic() < stop_at:
+            started = time.monotonic()
+            for _ in range(self.args.rate):
+                if len(in_flight) < self.args.concurrency:
+                    task = asyncio.create_task(self.session())
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+            if tick % 5 == 0:
+                for server in range(self.args.servers):
+                    task = asyncio.create_task(self.game_server_tick(server))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+            tick += 1
+            await asyncio.sleep(max(0.0, 1.0 - (time.monotonic() - started)))
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+
+def cache_sizes(env) -> dict:
+    import db
+    from bot_api import bridge
+    from bot_commands import _SWORD_PAGES
+    from member_cache import member_cache
+    from username_index import username_index
+
+    return {
+        "profile_cache": len(db.PROFILE_CACHE),
+        "sword_pages": len(_SWORD_PAGES),
+        "member_cache": member_cache.stats()["members"],
+        "member_absent": member_cache.stats()["absent"],
+        "username_index": len(username_index),
+        "bridge_channels": bridge.channel_stats()["cached"],
+        "bridge_queued": sum(q["queued"] for q in bridge.log_stats().values()),
+        "live_views": env.bot.live_views,
+        "tasks": len(asyncio.all_tasks()),
+    }
+
+
+async def monitor(soak: Soak, stop_at: float, samples: list, started: float):
+    args = soak.args
+    baseline = None
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(min(args.interval, max(0.0, stop_at - time.monotonic())))
+        gc.collect()
+        elapsed = time.monotonic() - started
+        traced, _ = tracemalloc.get_traced_memory()
+        sample = {"t": round(elapsed, 1), "rss": rss_bytes(), "traced": traced, **soak.counts, **cache_sizes(soak.env)}
+        samples.append(sample)
+
+        print(
+            f"[Soak] {elapsed / 60:7.1f} min  rss {sample['rss'] / 2**20:7.1f} MiB  traced {traced / 2**20:7.1f} MiB  "
+            f"sessions {sample['sessions']}  api {sample['api_requests']} ({sample['api_errors']} err)  "
+            f"views {sample['live_views']}  log queue {sample['bridge_queued']}  tasks {sample['tasks']}"
+        )
+
+        if elapsed >= args.warmup:
+            snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+            if baseline is None:
+                baseline = snapshot  # référence = premier instantané après le warmup
+            elif args.top:
+                key = "traceback" if args.frames > 1 else "lineno"
+                for stat in snapshot.compare_to(baseline, key)[:args.top]:
+                    if stat.size_diff <= 0:
+                        continue
+                    print(f"         +{stat.size_diff / 1024:9.1f} KiB  {stat.traceback[0]}")
+                    for frame in list(stat.traceback)[1:]:
+                        print(f"                         <- {frame}")
+
+
+def verdict(samples: list, args) -> tuple:
+    steady = [s for s in samples if s["t"] >= args.warmup]
+    # pente sur la 2e moitié : les caches bornés et les arènes de l'allocateur finissent de se remplir avant
+    fit = steady[len(steady) // 2:] if len(steady) >= 6 else steady
+    traced = slope_per_hour([(s["t"], s["traced"]) for s in fit]) / 2**20
+    rss = slope_per_hour([(s["t"], s["rss"]) for s in fit]) / 2**20
+    failures = []
+    if len(steady) < 3:
+        failures.append(f"only {len(steady)} samples after warmup: increase --duration or lower --interval")
+    if traced > args.max_traced_growth:
+        failures.append(f"traced memory grows {traced:.2f} MiB/h (max {args.max_traced_growth})")
+    if rss > args.max_rss_growth:
+        failures.append(f"RSS grows {rss:.2f} MiB/h (max {args.max_rss_growth})")
+    return {"traced_mib_per_hour": round(traced, 3), "rss_mib_per_hour": round(rss, 3)}, failures
+
+
+async def run(args) -> tuple:
+    import api
+    from config import ROBLOX_API_KEY
+
+    tracemalloc.start(args.frames)
+    env = await build_env(args)
+    env.bot.view_ttl = args.view_ttl
+    args.api_key = ROBLOX_API_KEY
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://slfo", timeout=30)
+    soak = Soak(env, client, args)
+
+    print(f"soak for {args.duration / 60:.0f} min: {args.rate} sessions/s, {args.servers} game servers, "
+          f"{len(env.linked)} linked users, snapshots every {args.interval}s after {args.warmup}s warmup")
+    samples: list = []
+    started = time.monotonic()
+    stop_at = started + args.duration
+    await asyncio.gather(soak.traffic(stop_at), monitor(soak, stop_at, samples, started))
+    await client.aclose()
+    tracemalloc.stop()
+    return samples, verdict(samples, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running synthetic traffic with memory growth checks")
+    parser.add_argument("--duration", type=float, default=3600, help="seconds")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between memory snapshots")
+    parser.add_argument("--warmup", type=float, default=300,
+                        help="seconds ignored by the growth check; must exceed the longest view timeout (or --view-ttl), "
+                             "otherwise views not yet expired show up as growth")
+    parser.add_argument("--rate", type=int, default=5, help="command sessions started per second")
+    parser.add_argument("--concurrency", type=int, default=100, help="max sessions in flight")
+    parser.add_argument("--servers", type=int, default=10, help="simulated game servers (every 5s)")
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--members", type=int, default=500, help="members per guild (half of them linked)")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake REST latency (s)")
+    parser.add_argument("--role-limit", default="10/1")
+    parser.add_argument("--global-limit", default="50/1")
+    parser.add_argument("--raise-429", action="store_true")
+    parser.add_argument("--view-ttl", type=float, default=None, help="seconds views stay referenced (default: view.timeout)")
+    parser.add_argument("--frames", type=int, default=1, help="tracemalloc traceback depth (deeper = slower snapshots)")
+    parser.add_argument("--top", type=int, default=10, help="allocation sites growing the most, per snapshot")
+    parser.add_argument("--max-traced-growth", type=float, default=5.0, help="MiB/hour allowed (tracemalloc)")
+    parser.add_argument("--max-rss-growth", type=float, default=20.0, help="MiB/hour allowed (RSS)")
+    parser.add_argument("--db", default="")
+    parser.add_argument("--json", default="", help="write samples + verdict to this file")
+    args = parser.parse_args()
+
+    samples, (growth, failures) = asyncio.run(run(args))
+    print(f"\ngrowth after warmup: traced {growth['traced_mib_per_hour']} MiB/h, RSS {growth['rss_mib_per_hour']} MiB/h")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"growth": growth, "failures": failures, "samples": samples}, f, indent=2)
+
+    if failures:
+        for failure in failures:
+            print("FAIL:", failure)
+        sys.exit(1)
+    print("OK: no unbounded growth")
+
+
+if __name__ == "__main__":
+    main()
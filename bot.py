@@ -9,6 +9,7 @@ from discord.ext import commands
 from config import DISCORD_TOKEN, GUILD_ID
 from db import init_db, store_code, get_link_by_discord
 from bot_api import bridge
+from startup import ReadyTimer, sync_command_tree
 
 def make_code(length: int = 8) -> str:
     alphabet = string.ascii_uppercase + string.digits
@@ -18,24 +19,41 @@ def make_code(length: int = 8) -> str:
 intents = discord.Intents.default()
 bot = commands.Bot(command_prefix="!", intents=intents)
 
-@bot.event
-async def on_ready():
+ready_timer = ReadyTimer()
+
+
+async def setup_hook():
+    # une seule fois par process (pas à chaque reconnexion gateway)
     await init_db()
     bridge.set_bot(bot)
 
-    # Sync slash commands
+    # Sync slash commands (seulement si l'arbre a changé)
     try:
         if GUILD_ID:
             guild = discord.Object(id=GUILD_ID)
             bot.tree.copy_global_to(guild=guild)
-            await bot.tree.sync(guild=guild)
+            await sync_command_tree(bot.tree, guild=guild)
         else:
-            await bot.tree.sync()
+            await sync_command_tree(bot.tree)
     except Exception as e:
         print("Slash command sync error:", e)
 
+bot.setup_hook = setup_hook
+
+
+@bot.event
+async def on_ready():
+    ready_timer.ready("ready")
     print(f"Logged in as {bot.user} (id={bot.user.id})")
 
+@bot.event
+async def on_resumed():
+    ready_timer.ready("resumed")
+
+@bot.event
+async def on_disconnect():
+    ready_timer.disconnected()
+
 @bot.tree.command(name="link", description="Génère un code pour lier ton compte Roblox")
 async def link_cmd(interaction: discord.Interaction):
     code = make_code()
@@ -1,27 +1,247 @@
 # bot_api.py
+import asyncio
+import time
+from collections import deque
+
+import discord
+
+from cache import LRUCache
+
+CHANNEL_CACHE_SIZE = 1024
+CHANNEL_CACHE_TTL_SECONDS = 3600
+CHANNEL_NEGATIVE_TTL_SECONDS = 300  # salon supprimé / interdit -> pas de REST à chaque event
+
+LOG_FLUSH_WINDOW_SECONDS = 2.0
+LOG_MAX_EMBEDS_PER_MESSAGE = 10
+LOG_MAX_MESSAGE_CHARS = 6000  # limite Discord sur la somme des embeds d'un message
+LOG_QUEUE_MAX = 500           # par salon ; au-delà on jette les plus anciens
+LOG_RETRY_SECONDS = 10.0      # salon non résolu (erreur transitoire) -> on garde la file et on réessaie
+
+
+class ChannelFetchError(Exception):
+    """fetch_channel failed transiently (network, 5xx): the channel may exist, nothing is cached."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _LogChannelQueue:
+    def __init__(self):
+        self.embeds = deque()
+        # ~5 messages / 5s par salon (bucket Discord)
+        self.bucket = TokenBucket(rate=1.0, capacity=5)
+        self.task = None
+        self.dropped = 0          # total jeté (file pleine / salon introuvable / envoi KO)
+        self.dropped_pending = 0  # pas encore signalé dans le salon
+        self.sent_messages = 0
+        self.sent_embeds = 0
+
+
 class BotBridge:
     def __init__(self):
         self._bot = None
+        self._log_queues: dict[int, _LogChannelQueue] = {}
+        # plafond global des envois de logs, bien sous la limite globale -> les interactions gardent de la marge
+        self._log_bucket = TokenBucket(rate=10.0, capacity=10)
+
+        self._channels = LRUCache(maxsize=CHANNEL_CACHE_SIZE, ttl=CHANNEL_CACHE_TTL_SECONDS)
+        self._missing_channels = LRUCache(maxsize=CHANNEL_CACHE_SIZE, ttl=CHANNEL_NEGATIVE_TTL_SECONDS)
+        self._channel_stats = {"hits": 0, "misses": 0, "negative_hits": 0, "fetch_errors": 0}
 
     def set_bot(self, bot):
         self._bot = bot
 
+    # ===== Channel resolution =====
+
+    def forget_channel(self, channel_id: int, missing: bool = False):
+        self._channels.pop(int(channel_id))
+        if missing:
+            self._missing_channels.set(int(channel_id), True)
+
+    async def resolve_channel(self, channel_id: int):
+        """Cached get_channel -> fetch_channel; NotFound/Forbidden are remembered for a few minutes.
+
+        Returns None when the channel is unavailable, raises ChannelFetchError on transient errors.
+        """
+        if self._bot is None:
+            return None
+
+        cid = int(channel_id)
+        if self._missing_channels.get(cid):
+            self._channel_stats["negative_hits"] += 1
+            return None
+
+        channel = self._channels.get(cid) or self._bot.get_channel(cid)
+        if channel is not None:
+            self._channel_stats["hits"] += 1
+            self._channels.set(cid, channel)
+            return channel
+
+        self._channel_stats["misses"] += 1
+        try:
+            channel = await self._bot.fetch_channel(cid)
+        except (discord.NotFound, discord.Forbidden) as e:
+            print(f"[Bridge] channel {cid} unavailable, caching miss:", e)
+            self.forget_channel(cid, missing=True)
+            return None
+        except Exception as e:
+            # erreur transitoire (réseau, 5xx) -> pas de cache négatif
+            self._channel_stats["fetch_errors"] += 1
+            print("[Bridge] fetch_channel failed:", e)
+            raise ChannelFetchError(cid) from e
+
+        self._channels.set(cid, channel)
+        return channel
+
+    async def send(self, channel_id: int, *args, **kwargs):
+        channel = await self.resolve_channel(channel_id)
+        if channel is None:
+            return None
+        try:
+            return await channel.send(*args, **kwargs)
+        except (discord.NotFound, discord.Forbidden):
+            self.forget_channel(channel_id, missing=True)
+            raise
+
+    def channel_stats(self) -> dict:
+        return {
+            **self._channel_stats,
+            "cached": len(self._channels),
+            "negative_cached": len(self._missing_channels),
+        }
+
     async def announce_link(self, channel_id: int, message: str):
         if self._bot is None:
             print("[Bridge] Bot not set (cannot announce)")
             return
 
-        channel = self._bot.get_channel(channel_id)
-        if channel is None:
-            try:
-                channel = await self._bot.fetch_channel(channel_id)
-            except Exception as e:
-                print("[Bridge] fetch_channel failed:", e)
-                return
-
         try:
-            await channel.send(message)
+            await self.send(channel_id, message)
         except Exception as e:
             print("[Bridge] channel.send failed:", e)
 
+    # ===== Log digest =====
+
+    def post_embed(self, channel_id: int, embed: discord.Embed):
+        """Queue a log embed; it is sent within a short window, batched up to 10 embeds per message."""
+        cid = int(channel_id)
+        q = self._log_queues.get(cid)
+        if q is None:
+            q = self._log_queues[cid] = _LogChannelQueue()
+
+        if self._missing_channels.get(cid):
+            self._channel_stats["negative_hits"] += 1
+            q.dropped += 1
+            return
+
+        if len(q.embeds) >= LOG_QUEUE_MAX:
+            q.embeds.popleft()
+            q.dropped += 1
+            q.dropped_pending += 1
+        q.embeds.append(embed)
+
+        if q.task is None or q.task.done():
+            q.task = asyncio.create_task(self._drain_logs(cid, q))
+
+    def _take_batch(self, q: _LogChannelQueue) -> tuple:
+        """(embeds taken from the queue, number of drops reported by an appended notice embed)"""
+        batch, size = [], 0
+        room = LOG_MAX_EMBEDS_PER_MESSAGE - (1 if q.dropped_pending else 0)
+        while q.embeds and len(batch) < room:
+            n = len(q.embeds[0])
+            if batch and size + n > LOG_MAX_MESSAGE_CHARS:
+                break
+            batch.append(q.embeds.popleft())
+            size += n
+
+        return batch, q.dropped_pending
+
+    @staticmethod
+    def _with_notice(batch: list, reported: int) -> list:
+        if not reported:
+            return batch
+        summary = discord.Embed(
+            title="⚠️ Log backlog",
+            description=f"{reported} log event(s) dropped (queue full or send failed).",
+            color=0xE67E22,
+        )
+        return batch + [summary]
+
+    @staticmethod
+    def _requeue(q: _LogChannelQueue, batch: list):
+        """Put an unsent batch back at the head, then enforce LOG_QUEUE_MAX (oldest dropped first)."""
+        q.embeds.extendleft(reversed(batch))
+        while len(q.embeds) > LOG_QUEUE_MAX:
+            q.embeds.popleft()
+            q.dropped += 1
+            q.dropped_pending += 1
+
+    async def _drain_logs(self, channel_id: int, q: _LogChannelQueue):
+        while q.embeds:
+            await asyncio.sleep(LOG_FLUSH_WINDOW_SECONDS)
+            await q.bucket.acquire()
+            await self._log_bucket.acquire()
+
+            if self._bot is None:
+                print("[Bridge] Bot not set (dropping logs)")
+                q.dropped += len(q.embeds)
+                q.embeds.clear()
+                return
+
+            batch, reported = self._take_batch(q)
+            try:
+                msg = await self.send(channel_id, embeds=self._with_notice(batch, reported))
+                if msg is None:
+                    # salon introuvable (éventuellement en cache négatif) -> on vide la file
+                    q.dropped += len(batch) + len(q.embeds)
+                    q.embeds.clear()
+                    return
+                q.sent_messages += 1
+                q.sent_embeds += len(batch)
+                q.dropped_pending -= reported  # d'autres pertes ont pu arriver pendant l'envoi
+            except ChannelFetchError:
+                # salon peut-être présent : on remet le lot en tête et on réessaie plus tard
+                self._requeue(q, batch)
+                await asyncio.sleep(LOG_RETRY_SECONDS)
+            except discord.HTTPException as e:
+                print(f"[Bridge] log send failed ({channel_id}):", e)
+                if e.status == 429:
+                    # le digest est là pour absorber les 429 : lot remis en tête, envoyé après retry_after
+                    self._requeue(q, batch)
+                    await asyncio.sleep(float(getattr(e, "retry_after", 0) or 5))
+                    continue
+                q.dropped += len(batch)
+                q.dropped_pending += len(batch)
+            except Exception as e:
+                print(f"[Bridge] log send failed ({channel_id}):", e)
+                q.dropped += len(batch)
+                q.dropped_pending += len(batch)
+
+    def log_stats(self) -> dict:
+        return {
+            cid: {
+                "queued": len(q.embeds),
+                "dropped": q.dropped,
+                "sent_messages": q.sent_messages,
+                "sent_embeds": q.sent_embeds,
+            }
+            for cid, q in self._log_queues.items()
+        }
+
+
 bridge = BotBridge()
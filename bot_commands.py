@@ -1,3 +1,5 @@
+import csv
+import io
 import secrets
 import string
 import time
@@ -5,6 +7,13 @@ import discord
 from discord import app_commands
 import os
 import httpx
+from bot_api import bridge
+from cache import LRUCache
+from username_index import username_index
+from member_cache import member_cache
+from reconcile import reconciler
+from ipc import IPC_PATH
+from sharding import CLUSTER_COUNT, CLUSTER_ID, SHARD_COUNT, ShardRouter, cluster_for_guild
 from config import (
     OFFICIAL_GUILD_ID,
     DEV_GUILD_ID,
@@ -19,12 +28,17 @@ from db import (
     delete_unused_codes_for_user,
     get_link_by_roblox_username,
     get_link_by_roblox_user_id,
+    list_links,
     get_profile_by_roblox_user_id,
     enqueue_admin_action,
+    enqueue_admin_actions_bulk,
+    resolve_links_bulk,
     get_guild_settings,
     upsert_guild_settings,
+    invalidate_guild_settings,
     get_leaderboard,
     create_store_purchase,
+    PROFILE_CACHE_SIZE,
 )
 
 EMBED_COLOR = 0x0B2E1A  # SLFO dark forest green
@@ -54,9 +68,93 @@ def build_sword_lines(swords: dict):
     return lines, sum(qty for _, qty in items), len(items)
 
 
+# roblox_user_id -> (profil source, pages) ; les pages suivent l'objet profil mis en cache par db.py
+_SWORD_PAGES = LRUCache(maxsize=PROFILE_CACHE_SIZE)
+
+
+def build_sword_pages(swords: dict) -> list[str]:
+    sword_lines, _, _ = build_sword_lines(swords)
+    if not sword_lines:
+        return ["```text\nNone\n```"]
+    return ["```text\n" + "\n".join(p) + "\n```" for p in chunk_lines(sword_lines, 15)]
+
+
+def get_sword_pages(roblox_user_id: int, profile: dict) -> list[str]:
+    cached = _SWORD_PAGES.get(int(roblox_user_id))
+    # même objet profil = même inventaire (save_player_profile remplace l'objet en cache)
+    if cached is not None and cached[0] is profile:
+        return cached[1]
+
+    pages = build_sword_pages(profile.get("swords") or {})
+    _SWORD_PAGES.set(int(roblox_user_id), (profile, pages))
+    return pages
+
+
 def _safe_amount(x: int) -> int:
     return max(0, int(x))
 
+
+def _is_digits(s: str) -> bool:
+    # str.isdigit() accepte "²" ou "٣" que int() refuse
+    return s.isascii() and s.isdigit()
+
+
+BULK_MAX_BYTES = 2_000_000
+BULK_MAX_ROWS = 20_000
+BULK_MAX_AMOUNT = 10**12  # bien sous 2**63 (INTEGER SQLite), et au-delà de toute économie du jeu
+SQLITE_MAX_INT = 2**63 - 1
+BULK_ACTIONS = {
+    "BANK_ADD": "BANK_ADD",
+    "VAULT_ADD": "BANK_ADD",
+    "BANK_REMOVE": "BANK_REMOVE",
+    "VAULT_REMOVE": "BANK_REMOVE",
+    "HAND_REMOVE": "HAND_REMOVE",
+}
+
+
+def parse_bulk_actions_csv(text: str):
+    """Rows "pseudo_or_id,action,amount" -> ([(line, ref, action, amount)], [errors])."""
+    rows, errors = [], []
+    for line_no, cols in enumerate(csv.reader(io.StringIO(text)), start=1):
+        cols = [c.strip() for c in cols]
+        if not cols or not cols[0] or cols[0].startswith("#"):
+            continue
+        if len(cols) < 3:
+            errors.append(f"L{line_no}: expected 3 columns")
+            continue
+
+        ref, action, amount = cols[0], BULK_ACTIONS.get(cols[1].upper()), cols[2]
+        if action is None:
+            # ligne d'en-tête (pseudo,action,amount) tolérée
+            if line_no == 1:
+                continue
+            errors.append(f"L{line_no}: unknown action `{cols[1][:20]}`")
+            continue
+        if not _is_digits(amount) or not 0 < int(amount) <= BULK_MAX_AMOUNT:
+            errors.append(f"L{line_no}: invalid amount `{amount[:20]}`")
+            continue
+        if not ref.isascii() or (_is_digits(ref) and int(ref) > SQLITE_MAX_INT):
+            errors.append(f"L{line_no}: invalid pseudo or id `{ref[:20]}`")
+            continue
+
+        rows.append((line_no, ref, action, _safe_amount(int(amount))))
+    return rows, errors
+
+_CLUSTER_ROUTER: ShardRouter | None = None
+
+
+async def notify_guild_config_changed(guild_id: int):
+    """Drop cached settings and reconcile the guild here, or on its owning cluster (multi-cluster mode)."""
+    global _CLUSTER_ROUTER
+    if CLUSTER_COUNT > 1 and SHARD_COUNT > 0 and cluster_for_guild(guild_id) != CLUSTER_ID:
+        if _CLUSTER_ROUTER is None:
+            _CLUSTER_ROUTER = ShardRouter(IPC_PATH)
+        await _CLUSTER_ROUTER.send("guild_config_changed", route_guild_id=int(guild_id), guild_id=int(guild_id))
+        return
+    invalidate_guild_settings(guild_id)
+    reconciler.schedule(guild_id, "config")
+
+
 def is_official_admin():
     async def predicate(interaction: discord.Interaction) -> bool:
         # Doit être dans un serveur
@@ -92,6 +190,80 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
             ephemeral=True
         )
 
+async def linked_username_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    if not username_index.loaded:
+        username_index.load(await list_links())
+    # value = roblox_user_id -> résolu par clé, pas par scan sur le nom
+    return [
+        app_commands.Choice(name=name, value=str(rid))
+        for name, rid in username_index.search(current, limit=25)
+    ]
+
+# ==================== Leaderboard render cache ====================
+
+LEADERBOARD_TITLES = {
+    "points": "🏆 Top 10 — Points",
+    "kills": "🏆 Top 10 — Kills",
+    "robux": "🏆 Top 10 — Robux Donated",
+}
+LEADERBOARD_SUFFIXES = {
+    "points": "pts",
+    "kills": "kills",
+    "robux": "R$",
+}
+
+# key -> (updated_at, embed dict sans footer) ; rempli par /leaderboard/update
+_LEADERBOARD_EMBEDS: dict[str, tuple[int, dict]] = {}
+# key -> dernière vérification en DB (monotonic) : l'effet leaderboard_saved peut être perdu (IPC split/sharding)
+_LEADERBOARD_CHECKED: dict[str, float] = {}
+LEADERBOARD_RECHECK_SECONDS = 30
+
+
+def build_leaderboard_embed_dict(key: str, data: list) -> dict:
+    e = discord.Embed(title=LEADERBOARD_TITLES.get(key, "🏆 Top 10"), color=EMBED_COLOR)
+    lines = []
+    for i, entry in enumerate(data[:10], start=1):
+        username = entry.get("username", "Unknown")
+        value = int(entry.get("value", 0))
+        lines.append(f"**#{i}** {username} — **{format_number(value)} {LEADERBOARD_SUFFIXES.get(key, '')}**")
+    e.description = "\n".join(lines)
+    return e.to_dict()
+
+
+def prime_leaderboard_embed(key: str, data: list, updated_at: int):
+    """Prebuild the embed for a freshly saved board (called by the API on /leaderboard/update)."""
+    cached = _LEADERBOARD_EMBEDS.get(key)
+    if cached is not None and cached[0] > int(updated_at):
+        return
+    if not data:
+        _LEADERBOARD_EMBEDS.pop(key, None)
+        return
+    _LEADERBOARD_EMBEDS[key] = (int(updated_at), build_leaderboard_embed_dict(key, data))
+
+
+async def get_leaderboard_embed(key: str) -> discord.Embed:
+    cached = _LEADERBOARD_EMBEDS.get(key)
+    now = time.monotonic()
+    if cached is None or now - _LEADERBOARD_CHECKED.get(key, 0.0) >= LEADERBOARD_RECHECK_SECONDS:
+        # cache froid (redémarrage) ou vérification périodique -> une lecture DB, rendu refait si updated_at a bougé
+        _LEADERBOARD_CHECKED[key] = now
+        lb = await get_leaderboard(key)
+        if lb and lb["data"] and (cached is None or int(lb["updated_at"]) > cached[0]):
+            prime_leaderboard_embed(key, lb["data"], int(lb["updated_at"]))
+        cached = _LEADERBOARD_EMBEDS.get(key)
+
+    if cached is None:
+        e = discord.Embed(title=LEADERBOARD_TITLES.get(key, "🏆 Top 10"), color=EMBED_COLOR)
+        e.description = "No data yet. (Waiting for Roblox push)"
+        e.set_footer(text="SLFO — Leaderboard")
+        return e
+
+    updated_at, embed_dict = cached
+    e = discord.Embed.from_dict(dict(embed_dict))
+    updated_ago = max(0, int(time.time()) - updated_at)
+    e.set_footer(text=f"Updated {updated_ago}s ago • SLFO — Leaderboard")
+    return e
+
 # ==================== View ====================
 
 class SwordInventoryView(discord.ui.View):
@@ -302,6 +474,9 @@ def setup_commands(tree: app_commands.CommandTree):
         if not removed:
             await interaction.followup.send("❌ Not linked.", ephemeral=True)
             return
+        if link_before:
+            username_index.remove(int(link_before[1]))
+        member_cache.remove_linked(interaction.user.id)
             
         # 🧹 remove role (sur le serveur officiel uniquement)
         try:
@@ -325,8 +500,7 @@ def setup_commands(tree: app_commands.CommandTree):
             settings = await get_current_guild_settings(interaction)
             log_channel_id = settings.get("admin_log_channel_id") if settings else None
 
-            ch = interaction.client.get_channel(int(log_channel_id)) if log_channel_id else None
-            if ch:
+            if log_channel_id:
                 embed = discord.Embed(
                     title="🔓 Account Unlinked",
                     color=0xE67E22
@@ -347,7 +521,7 @@ def setup_commands(tree: app_commands.CommandTree):
                     )
 
                 embed.set_footer(text="SLFO — Link System")
-                await ch.send(embed=embed)
+                bridge.post_embed(int(log_channel_id), embed)
         except Exception as e:
             print("[BOT] Unlink log failed:", e)
 
@@ -358,10 +532,11 @@ def setup_commands(tree: app_commands.CommandTree):
 
     @tree.command(name="profile", description="Show a player profile")
     @app_commands.describe(pseudo="Optional Roblox username")
+    @app_commands.autocomplete(pseudo=linked_username_autocomplete)
     async def profile_cmd(interaction, pseudo: str = None):
 
         if pseudo:
-            link = await (get_link_by_roblox_user_id(int(pseudo)) if pseudo.isdigit() else get_link_by_roblox_username(pseudo))
+            link = await (get_link_by_roblox_user_id(int(pseudo)) if _is_digits(pseudo) else get_link_by_roblox_username(pseudo))
         else:
             link = await get_link_by_discord(interaction.user.id)
 
@@ -386,10 +561,7 @@ def setup_commands(tree: app_commands.CommandTree):
         tickets = int(profile["tickets"])
         robux = int(profile["robux_donated"])
 
-        sword_lines, _, _ = build_sword_lines(profile["swords"])
-        pages = ["```text\nNone\n```"] if not sword_lines else [
-            "```text\n" + "\n".join(p) + "\n```" for p in chunk_lines(sword_lines, 15)
-        ]
+        pages = get_sword_pages(roblox_id, profile)
 
         embed = discord.Embed(title="Profile — SLFO", color=EMBED_COLOR)
         embed.add_field(name="Last updated", value=f"{updated_ago}s ago", inline=False)
@@ -414,18 +586,8 @@ def setup_commands(tree: app_commands.CommandTree):
 
         discord_id, roblox_id, roblox_name, _ = link
 
-        async def send_log(embed: discord.Embed):
-            ch = interaction.client.get_channel(int(STORE_LOG_CHANNEL_ID))
-            if ch is None:
-                try:
-                    ch = await interaction.client.fetch_channel(int(STORE_LOG_CHANNEL_ID))
-                except Exception:
-                    ch = None
-            if ch:
-                try:
-                    await ch.send(embed=embed)
-                except Exception:
-                    pass
+        def send_log(embed: discord.Embed):
+            bridge.post_embed(int(STORE_LOG_CHANNEL_ID), embed)
 
         async def on_choose(inter: discord.Interaction, item_key: str):
             chosen = None
@@ -448,24 +610,37 @@ def setup_commands(tree: app_commands.CommandTree):
             embed.set_footer(text="Confirm to queue. Points will be removed in-game (via AdminActionPoller).")
 
             async def on_confirm(confirm_inter: discord.Interaction, item: dict):
-                # re-check at confirm time
-                prof2 = await get_profile_by_roblox_user_id(int(roblox_id))
-                points2 = int(prof2["points"]) if prof2 else 0
+                # check + achat + HAND_REMOVE dans une seule transaction ; la clé rend le double-clic inoffensif
+                result = await create_store_purchase(
+                    discord_id=int(discord_id),
+                    roblox_user_id=int(roblox_id),
+                    roblox_username=str(roblox_name),
+                    item_key=item["key"],
+                    cost_points=int(item["cost"]),
+                    reward_robux=int(item["reward"]),
+                    idempotency_key=f"store:{inter.id}",
+                )
 
-                if points2 < int(item["cost"]):
-                    await confirm_inter.followup.send(
-                        f"❌ Not enough points. You have {format_number(points2)}.",
-                        ephemeral=True
-                    )
+                if not result["ok"]:
+                    if result["error"] == "not_enough_points":
+                        await confirm_inter.followup.send(
+                            f"❌ Not enough points. You have {format_number(result['points'])}.",
+                            ephemeral=True
+                        )
+                    else:
+                        await confirm_inter.followup.send(
+                            "⏳ You already have a purchase pending. Wait for Roblox to apply it.",
+                            ephemeral=True
+                        )
                     return
 
-                if await has_pending_action(int(roblox_id), "HAND_REMOVE"):
+                action_id = result["action_id"]
+                if result["duplicate"]:
                     await confirm_inter.followup.send(
-                        "⏳ You already have a purchase pending. Wait for Roblox to apply it.",
+                        f"✅ Purchase already queued (ActionId `{action_id}`).",
                         ephemeral=True
                     )
                     return
-                action_id = await enqueue_admin_action(int(roblox_id), "HAND_REMOVE", int(item["cost"]))
 
                 log = discord.Embed(title="🛒 Store Purchase Queued", color=0x2ECC71)
                 log.add_field(name="Discord", value=f"<@{discord_id}> (`{discord_id}`)", inline=False)
@@ -475,7 +650,7 @@ def setup_commands(tree: app_commands.CommandTree):
                 log.add_field(name="Reward", value=f"{item['reward']} Robux", inline=True)
                 log.add_field(name="ActionId", value=f"`{action_id}`", inline=True)
                 log.set_footer(text="Roblox will apply HAND_REMOVE shortly.")
-                await send_log(log)
+                send_log(log)
 
                 await confirm_inter.followup.send(
                     f"✅ Purchase queued! ActionId `{action_id}`.\nPoints will be removed in-game shortly.",
@@ -495,41 +670,8 @@ def setup_commands(tree: app_commands.CommandTree):
 
     @tree.command(name="leaderboard", description="Show Top 10 leaderboard (Points/Kills/Robux)")
     async def leaderboard_cmd(interaction: discord.Interaction):
-        async def make_embed(key: str) -> discord.Embed:
-            lb = await get_leaderboard(key)
-            now = int(time.time())
-
-            title_map = {
-                "points": "🏆 Top 10 — Points",
-                "kills": "🏆 Top 10 — Kills",
-                "robux": "🏆 Top 10 — Robux Donated",
-            }
-            suffix_map = {
-                "points": "pts",
-                "kills": "kills",
-                "robux": "R$",
-            }
-
-            e = discord.Embed(title=title_map.get(key, "🏆 Top 10"), color=EMBED_COLOR)
-
-            if not lb or not lb["data"]:
-                e.description = "No data yet. (Waiting for Roblox push)"
-                e.set_footer(text="SLFO — Leaderboard")
-                return e
-
-            updated_ago = max(0, now - int(lb["updated_at"]))
-            lines = []
-            for i, entry in enumerate(lb["data"][:10], start=1):
-                username = entry.get("username", "Unknown")
-                value = int(entry.get("value", 0))
-                lines.append(f"**#{i}** {username} — **{format_number(value)} {suffix_map[key]}**")
-
-            e.description = "\n".join(lines)
-            e.set_footer(text=f"Updated {updated_ago}s ago • SLFO — Leaderboard")
-            return e
-
-        view = LeaderboardView(interaction.user.id, "points", make_embed)
-        await interaction.response.send_message(embed=await make_embed("points"), view=view, ephemeral=False)
+        view = LeaderboardView(interaction.user.id, "points", get_leaderboard_embed)
+        await interaction.response.send_message(embed=await get_leaderboard_embed("points"), view=view, ephemeral=False)
 
     @tree.command(name="guild_config_set", description="(Official) Configure roles/channels for a target guild")
     @is_official_admin()
@@ -556,7 +698,7 @@ def setup_commands(tree: app_commands.CommandTree):
             if x is None:
                 return None
             x = x.strip()
-            return int(x) if x.isdigit() else None
+            return int(x) if _is_digits(x) else None
 
         gid = int(target_guild_id)
 
@@ -569,6 +711,9 @@ def setup_commands(tree: app_commands.CommandTree):
             admin_log_channel_id=to_int(admin_log_channel_id),
         )
 
+        # rôles peut-être changés -> réconciliation du serveur, sur le cluster qui le possède
+        await notify_guild_config_changed(gid)
+
         await interaction.followup.send(f"✅ Settings enregistrés pour `{gid}`.", ephemeral=True)
     
     @tree.command(name="guild_config_show", description="(Official) Show config for a target guild")
@@ -597,9 +742,10 @@ def setup_commands(tree: app_commands.CommandTree):
 
     @tree.command(name="vault_add", description="(Admin) Add Light to a player's Vault")
     @is_official_admin()
+    @app_commands.autocomplete(pseudo=linked_username_autocomplete)
     async def vault_add_cmd(interaction, pseudo: str, amount: int):
         amount = _safe_amount(amount)
-        link = await (get_link_by_roblox_user_id(int(pseudo)) if pseudo.isdigit() else get_link_by_roblox_username(pseudo))
+        link = await (get_link_by_roblox_user_id(int(pseudo)) if _is_digits(pseudo) else get_link_by_roblox_username(pseudo))
         if not link:
             await interaction.response.send_message("❌ Not linked", ephemeral=True)
             return
@@ -610,9 +756,10 @@ def setup_commands(tree: app_commands.CommandTree):
 
     @tree.command(name="vault_remove", description="(Admin) Remove Light from a player's Vault")
     @is_official_admin()
+    @app_commands.autocomplete(pseudo=linked_username_autocomplete)
     async def vault_remove_cmd(interaction, pseudo: str, amount: int):
         amount = _safe_amount(amount)
-        link = await (get_link_by_roblox_user_id(int(pseudo)) if pseudo.isdigit() else get_link_by_roblox_username(pseudo))
+        link = await (get_link_by_roblox_user_id(int(pseudo)) if _is_digits(pseudo) else get_link_by_roblox_username(pseudo))
         if not link:
             await interaction.response.send_message("❌ Not linked", ephemeral=True)
             return
@@ -623,9 +770,10 @@ def setup_commands(tree: app_commands.CommandTree):
 
     @tree.command(name="hand_remove", description="(Admin) Remove Light from a player's hand")
     @is_official_admin()
+    @app_commands.autocomplete(pseudo=linked_username_autocomplete)
     async def hand_remove_cmd(interaction, pseudo: str, amount: int):
         amount = _safe_amount(amount)
-        link = await (get_link_by_roblox_user_id(int(pseudo)) if pseudo.isdigit() else get_link_by_roblox_username(pseudo))
+        link = await (get_link_by_roblox_user_id(int(pseudo)) if _is_digits(pseudo) else get_link_by_roblox_username(pseudo))
         if not link:
             await interaction.response.send_message("❌ Not linked", ephemeral=True)
             return
@@ -634,6 +782,63 @@ def setup_commands(tree: app_commands.CommandTree):
         action_id = await enqueue_admin_action(roblox_id, "HAND_REMOVE", amount)
         await interaction.response.send_message(f"✅ HAND_REMOVE {amount} queued for {name} (#{action_id})", ephemeral=True)
 
+    @tree.command(name="admin_bulk", description="(Admin) Queue economy actions from a CSV (pseudo_or_id,action,amount)")
+    @is_official_admin()
+    @app_commands.describe(file="CSV: pseudo_or_id,action,amount (BANK_ADD | BANK_REMOVE | HAND_REMOVE)")
+    async def admin_bulk_cmd(interaction: discord.Interaction, file: discord.Attachment):
+        await interaction.response.defer(ephemeral=True)
+
+        if file.size > BULK_MAX_BYTES:
+            await interaction.followup.send(f"❌ File too large (max {BULK_MAX_BYTES // 1_000_000} MB).", ephemeral=True)
+            return
+
+        try:
+            text = (await file.read()).decode("utf-8-sig")
+        except Exception as e:
+            await interaction.followup.send(f"❌ Cannot read file: {e}", ephemeral=True)
+            return
+
+        rows, errors = parse_bulk_actions_csv(text)
+        if len(rows) > BULK_MAX_ROWS:
+            await interaction.followup.send(f"❌ Too many rows ({len(rows)}, max {BULK_MAX_ROWS}).", ephemeral=True)
+            return
+
+        # une seule requête pour résoudre tous les pseudos / ids
+        links = await resolve_links_bulk([ref for _, ref, _, _ in rows])
+        by_id = {int(rid): (int(rid), name) for _, rid, name, _ in links}
+        by_name = {str(name).lower(): (int(rid), name) for _, rid, name, _ in links}
+
+        actions, unresolved = [], []
+        totals: dict[str, int] = {}
+        for line_no, ref, action, amount in rows:
+            hit = by_id.get(int(ref)) if _is_digits(ref) else by_name.get(ref.lower())
+            if hit is None:
+                unresolved.append(ref)
+                continue
+            actions.append((hit[0], action, amount))
+            totals[action] = totals.get(action, 0) + amount
+
+        try:
+            queued = await enqueue_admin_actions_bulk(actions)
+        except Exception as e:
+            # transaction annulée : rien n'est en file, mais l'admin doit avoir une réponse
+            print("[BOT] admin_bulk enqueue failed:", repr(e))
+            await interaction.followup.send(f"❌ Nothing queued, database error: {e}"[:1900], ephemeral=True)
+            return
+
+        lines = [f"✅ Queued **{queued}** actions for **{len({a[0] for a in actions})}** players."]
+        for action, total in sorted(totals.items()):
+            lines.append(f"• `{action}` total {format_number(total)}")
+        if unresolved:
+            shown = ", ".join(f"`{r[:30]}`" for r in unresolved[:20])
+            more = f" (+{len(unresolved) - 20} more)" if len(unresolved) > 20 else ""
+            lines.append(f"⚠️ Not linked ({len(unresolved)}): {shown}{more}")
+        if errors:
+            more = f"\n… +{len(errors) - 10} more" if len(errors) > 10 else ""
+            lines.append("❌ Invalid lines:\n" + "\n".join(errors[:10]) + more)
+
+        await interaction.followup.send("\n".join(lines)[:1900], ephemeral=True)
+
     @tree.command(name="admin_announce", description="(Admin) Global announcement in all Roblox servers")
     @is_official_admin()
     @app_commands.describe(message="Message to broadcast to all Roblox servers")
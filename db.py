@@ -1,16 +1,62 @@
-import aiosqlite
+import asyncio
+import itertools
+import json
+import sqlite3
 import time
-from typing import Optional
+from typing import Optional, List, Dict
+
+from cache import LRUCache
+from metrics import instrument_module
+import db_instrument
 
 DB_PATH = "links.db"
 
 
+def _connect():
+    # statements chronométrés, slow log, EXPLAIN QUERY PLAN (cf. db_instrument.py)
+    return db_instrument.connect(DB_PATH)
+
+
 # ==============================
 # ===== DB INITIALISATION =====
 # ==============================
 
+async def _ensure_column(db, table: str, column: str, decl: str):
+    cur = await db.execute(f"PRAGMA table_info({table})")
+    cols = {row[1] for row in await cur.fetchall()}
+    if column not in cols:
+        try:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        except sqlite3.OperationalError as e:
+            # mode split : plusieurs process migrent en même temps, un autre a ajouté la colonne entre-temps
+            if "duplicate column name" not in str(e):
+                raise
+
+
+# chemins déjà initialisés dans ce process (reconnexions gateway + startup FastAPI -> une seule fois)
+_initialized_paths: set = set()
+_init_lock: Optional[asyncio.Lock] = None
+
+
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    """Create/migrate the schema once per process and DB_PATH; later calls are no-ops."""
+    global _init_lock
+    if DB_PATH in _initialized_paths:
+        return
+    if _init_lock is None:
+        _init_lock = asyncio.Lock()
+
+    async with _init_lock:
+        if DB_PATH in _initialized_paths:
+            return
+        await _create_schema()
+        _initialized_paths.add(DB_PATH)
+
+
+async def _create_schema():
+    async with _connect() as db:
+        # WAL: les lectures ne bloquent plus pendant les transactions d'écriture (achats, queue admin)
+        await db.execute("PRAGMA journal_mode=WAL")
 
         await db.execute("""
         CREATE TABLE IF NOT EXISTS links (
@@ -39,10 +85,15 @@ async def init_db():
             done INTEGER DEFAULT 0,
             done_at INTEGER,
             success INTEGER,
-            result_text TEXT
+            result_text TEXT,
+            priority INTEGER NOT NULL DEFAULT 0,
+            merged_into INTEGER  -- id du groupe si renvoyé par un pull coalescé
         )
         """)
 
+        await _ensure_column(db, "admin_actions", "priority", "INTEGER NOT NULL DEFAULT 0")
+        await _ensure_column(db, "admin_actions", "merged_into", "INTEGER")
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS player_profiles (
             roblox_user_id INTEGER PRIMARY KEY,
@@ -71,6 +122,16 @@ async def init_db():
         )
         """)
 
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS leaderboard_contributions (
+            key TEXT NOT NULL,             -- "points" | "kills" | "robux"
+            server_id TEXT NOT NULL,       -- JobId du serveur Roblox
+            data TEXT NOT NULL,            -- JSON top K de ce serveur
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (key, server_id)
+        )
+        """)
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS store_purchases (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -81,10 +142,55 @@ async def init_db():
             cost_points INTEGER NOT NULL,
             reward_robux INTEGER NOT NULL,
             created_at INTEGER NOT NULL,
-            status TEXT NOT NULL DEFAULT 'queued' -- queued | applied | failed
+            status TEXT NOT NULL DEFAULT 'queued', -- queued | applied | failed
+            idempotency_key TEXT,
+            action_id INTEGER
+        )
+        """)
+
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS bot_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
         )
         """)
 
+        # anciennes bases: colonnes ajoutées après coup
+        await _ensure_column(db, "store_purchases", "idempotency_key", "TEXT")
+        await _ensure_column(db, "store_purchases", "action_id", "INTEGER")
+
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_links_roblox_user_id ON links(roblox_user_id)"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_links_username_lower ON links(lower(roblox_username))"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_link_codes_discord_id ON link_codes(discord_id)"
+        )
+        await db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_store_purchases_idem ON store_purchases(idempotency_key)"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_store_purchases_action ON store_purchases(action_id)"
+        )
+        await db.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_admin_actions_pending
+            ON admin_actions(priority DESC, queued_at, id) WHERE done=0
+            """
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_admin_actions_merged ON admin_actions(merged_into)"
+        )
+        await db.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_admin_actions_player_pending
+            ON admin_actions(roblox_user_id, action) WHERE done=0
+            """
+        )
+
         await db.commit()
 
 # ===========================
@@ -92,7 +198,7 @@ async def init_db():
 # ===========================
 
 async def store_code(code: str, discord_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "INSERT INTO link_codes VALUES (?, ?, ?)",
             (code, discord_id, int(time.time()))
@@ -101,25 +207,25 @@ async def store_code(code: str, discord_id: int):
 
 
 async def get_code(code: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute("SELECT discord_id, created_at FROM link_codes WHERE code=?", (code,))
         return await cur.fetchone()
 
 
 async def delete_code(code: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute("DELETE FROM link_codes WHERE code=?", (code,))
         await db.commit()
 
 
 async def delete_unused_codes_for_user(discord_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute("DELETE FROM link_codes WHERE discord_id=?", (discord_id,))
         await db.commit()
 
 
 async def store_link(discord_id: int, roblox_user_id: int, roblox_username: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?)",
             (discord_id, roblox_user_id, roblox_username, int(time.time()))
@@ -128,26 +234,40 @@ async def store_link(discord_id: int, roblox_user_id: int, roblox_username: str)
 
 
 async def delete_link(discord_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute("DELETE FROM links WHERE discord_id=?", (discord_id,))
         await db.commit()
         return cur.rowcount > 0
 
 
 async def get_link_by_discord(discord_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute("SELECT * FROM links WHERE discord_id=?", (discord_id,))
         return await cur.fetchone()
 
 
+async def get_links_by_discord_ids(discord_ids: List[int]) -> Dict[int, tuple]:
+    """discord_id -> link row for the linked ones, in one query."""
+    ids = [int(x) for x in discord_ids]
+    if not ids:
+        return {}
+
+    async with _connect() as db:
+        cur = await db.execute(
+            "SELECT * FROM links WHERE discord_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(ids),)
+        )
+        return {int(row[0]): row for row in await cur.fetchall()}
+
+
 async def get_link_by_roblox_user_id(roblox_user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute("SELECT * FROM links WHERE roblox_user_id=?", (roblox_user_id,))
         return await cur.fetchone()
 
 
 async def get_link_by_roblox_username(username: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute(
             "SELECT * FROM links WHERE lower(roblox_username)=lower(?)",
             (username,)
@@ -155,50 +275,195 @@ async def get_link_by_roblox_username(username: str):
         return await cur.fetchone()
 
 
+async def resolve_links_bulk(refs: List[str]):
+    """Links for a mix of roblox_user_ids (digits) and usernames, in one query."""
+    # isascii : str.isdigit() accepte des chiffres Unicode ("²") que int() refuse -> traités comme pseudos
+    ids = sorted({int(r) for r in refs if r.isascii() and r.isdigit()})
+    names = sorted({r.lower() for r in refs if not (r.isascii() and r.isdigit())})
+    if not ids and not names:
+        return []
+
+    async with _connect() as db:
+        cur = await db.execute(
+            """
+            SELECT * FROM links
+            WHERE roblox_user_id IN (SELECT value FROM json_each(?))
+               OR lower(roblox_username) IN (SELECT value FROM json_each(?))
+            """,
+            (json.dumps(ids), json.dumps(names))
+        )
+        return await cur.fetchall()
+
+
+async def get_link_status_batch(roblox_user_ids: List[int]):
+    """Link + VIP/BETA state for many Roblox users in one query (one row per requested id)."""
+    ids = [int(x) for x in roblox_user_ids]
+    if not ids:
+        return []
+
+    async with _connect() as db:
+        # json_each -> un seul paramètre, peu importe la taille du batch
+        cur = await db.execute(
+            """
+            SELECT ids.value, l.discord_id,
+                   CASE WHEN json_valid(p.data) THEN json_extract(p.data, '$.vip') END,
+                   CASE WHEN json_valid(p.data) THEN json_extract(p.data, '$.beta') END
+            FROM json_each(?) AS ids
+            LEFT JOIN links l ON l.roblox_user_id = ids.value
+            LEFT JOIN player_profiles p ON p.roblox_user_id = ids.value
+            """,
+            (json.dumps(ids),)
+        )
+        return await cur.fetchall()
+
+
+async def list_linked_role_flags() -> Dict[int, tuple]:
+    """discord_id -> (vip, beta) for every linked user (False when the profile is missing)."""
+    async with _connect() as db:
+        cur = await db.execute(
+            """
+            SELECT l.discord_id,
+                   CASE WHEN json_valid(p.data) THEN json_extract(p.data, '$.vip') END,
+                   CASE WHEN json_valid(p.data) THEN json_extract(p.data, '$.beta') END
+            FROM links l
+            LEFT JOIN player_profiles p ON p.roblox_user_id = l.roblox_user_id
+            """
+        )
+        return {int(d): (bool(vip), bool(beta)) for d, vip, beta in await cur.fetchall()}
+
+
 # ===========================
 # ===== ADMIN ACTIONS ======
 # ===========================
 
-async def enqueue_admin_action(roblox_user_id: int, action: str, amount: int) -> int:
+# priorité de pull: les achats du store passent avant les grants en masse
+ACTION_PRIORITY_STORE = 10
+ACTION_PRIORITY_ADMIN = 0
+ACTION_PRIORITY_BULK = -10
+
+_PENDING_COLUMNS = "id, roblox_user_id, action, amount, queued_at, priority, merged_into"
+_PENDING_ORDER = "ORDER BY priority DESC, queued_at, id"
+
+
+async def enqueue_admin_action(
+    roblox_user_id: int,
+    action: str,
+    amount: int,
+    priority: int = ACTION_PRIORITY_ADMIN,
+) -> int:
     now = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute(
             """
-            INSERT INTO admin_actions (roblox_user_id, action, amount, queued_at)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO admin_actions (roblox_user_id, action, amount, queued_at, priority)
+            VALUES (?, ?, ?, ?, ?)
             """,
-            (roblox_user_id, action, amount, now)
+            (roblox_user_id, action, amount, now, int(priority))
         )
         await db.commit()
         return cur.lastrowid
 
 
-async def get_pending_admin_actions():
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT * FROM admin_actions WHERE done=0 ORDER BY queued_at"
+async def enqueue_admin_actions_bulk(actions: List[tuple], priority: int = ACTION_PRIORITY_BULK) -> int:
+    """actions = [(roblox_user_id, action, amount), ...] -> one executemany in one transaction."""
+    if not actions:
+        return 0
+
+    now = int(time.time())
+    async with _connect() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        await db.executemany(
+            """
+            INSERT INTO admin_actions (roblox_user_id, action, amount, queued_at, priority)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(int(rid), str(action), int(amount), now, int(priority)) for rid, action, amount in actions]
         )
+        await db.commit()
+    return len(actions)
+
+
+async def get_pending_admin_actions(limit: Optional[int] = None):
+    """(id, roblox_user_id, action, amount, queued_at, priority, merged_into), highest priority first."""
+    async with _connect() as db:
+        if limit is None:
+            cur = await db.execute(
+                f"SELECT {_PENDING_COLUMNS} FROM admin_actions WHERE done=0 {_PENDING_ORDER}"
+            )
+        else:
+            cur = await db.execute(
+                f"SELECT {_PENDING_COLUMNS} FROM admin_actions WHERE done=0 {_PENDING_ORDER} LIMIT ?",
+                (int(limit),)
+            )
         return await cur.fetchall()
 
 
+async def pull_coalesced_admin_actions(limit: int) -> List[dict]:
+    """
+    Merge pending actions per (player, action, priority) into one net action.
+
+    Every returned row gets merged_into = group id (the smallest id), so the group is frozen:
+    later actions form new groups, and ack/report of the group id applies to all its rows.
+    """
+    async with _connect() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        cur = await db.execute(
+            f"SELECT {_PENDING_COLUMNS} FROM admin_actions WHERE done=0 {_PENDING_ORDER}"
+        )
+        rows = await cur.fetchall()
+
+        groups: Dict[object, List[tuple]] = {}
+        for row in rows:
+            action_id, roblox_user_id, action, amount, queued_at, priority, merged_into = row
+            # groupe déjà envoyé à un serveur -> figé ; sinon regroupe les lignes libres
+            key = ("frozen", merged_into) if merged_into is not None else ("free", roblox_user_id, action, priority)
+            groups.setdefault(key, []).append(row)
+
+        merged = []
+        for members in groups.values():
+            ids = sorted(r[0] for r in members)
+            first = members[0]
+            merged.append({
+                "id": first[6] if first[6] is not None else ids[0],
+                "ids": ids,
+                "roblox_user_id": first[1],
+                "action": first[2],
+                "amount": sum(int(r[3]) for r in members),
+                "queued_at": min(int(r[4]) for r in members),
+                "priority": int(first[5]),
+            })
+
+        merged.sort(key=lambda a: (-a["priority"], a["queued_at"], a["id"]))
+        merged = merged[: int(limit)]
+
+        await db.executemany(
+            "UPDATE admin_actions SET merged_into=? WHERE id=? AND merged_into IS NULL",
+            [(a["id"], i) for a in merged for i in a["ids"]]
+        )
+        await db.commit()
+
+    return merged
+
+
 async def mark_admin_action_done(action_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    # un id de groupe (pull coalescé) marque aussi toutes les actions fusionnées dedans
+    async with _connect() as db:
         await db.execute(
-            "UPDATE admin_actions SET done=1, done_at=? WHERE id=?",
-            (int(time.time()), action_id)
+            "UPDATE admin_actions SET done=1, done_at=? WHERE (id=? OR merged_into=?) AND done=0",
+            (int(time.time()), action_id, action_id)
         )
         await db.commit()
 
 
 async def set_admin_action_result(action_id: int, success: bool, result_text: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             """
             UPDATE admin_actions
             SET done=1, done_at=?, success=?, result_text=?
-            WHERE id=?
+            WHERE id=? OR merged_into=?
             """,
-            (int(time.time()), 1 if success else 0, result_text, action_id)
+            (int(time.time()), 1 if success else 0, result_text, action_id, action_id)
         )
         await db.commit()
 
@@ -207,19 +472,40 @@ async def set_admin_action_result(action_id: int, success: bool, result_text: st
 # ===== PLAYER PROFILE =====
 # ===========================
 
+PROFILE_CACHE_SIZE = 2048
+PROFILE_CACHE_TTL_SECONDS = 30  # autre process (split / shards) : l'effet profile_saved peut être perdu
+
+# roblox_user_id -> profil décodé (dict partagé : ne pas le modifier côté appelant)
+PROFILE_CACHE = LRUCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL_SECONDS)
+# roblox_user_id -> n° de la dernière sauvegarde, pour ne pas cacher une lecture concurrente périmée
+_PROFILE_SAVE_SEQ = LRUCache(maxsize=PROFILE_CACHE_SIZE * 4)
+_profile_save_counter = itertools.count(1)
+
+
+def invalidate_profile_cache(roblox_user_id: int):
+    _PROFILE_SAVE_SEQ.set(int(roblox_user_id), next(_profile_save_counter))
+    PROFILE_CACHE.pop(int(roblox_user_id))
+
+
 async def save_player_profile(roblox_user_id: int, data_json: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "INSERT OR REPLACE INTO player_profiles VALUES (?, ?, ?)",
             (roblox_user_id, data_json, int(time.time()))
         )
         await db.commit()
+    invalidate_profile_cache(roblox_user_id)
 
 
 import json
 
 async def get_profile_by_roblox_user_id(roblox_user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    cached = PROFILE_CACHE.get(int(roblox_user_id))
+    if cached is not None:
+        return cached
+
+    seq_before = _PROFILE_SAVE_SEQ.get(int(roblox_user_id), 0)
+    async with _connect() as db:
         cur = await db.execute(
             "SELECT data, updated_at FROM player_profiles WHERE roblox_user_id=?",
             (roblox_user_id,)
@@ -236,20 +522,23 @@ async def get_profile_by_roblox_user_id(roblox_user_id: int):
 
         # ✅ renvoie un dict plat comme attend bot_commands.py
         data["updated_at"] = updated_at
-        return data
+
+    if _PROFILE_SAVE_SEQ.get(int(roblox_user_id), 0) == seq_before:
+        PROFILE_CACHE.set(int(roblox_user_id), data)
+    return data
 
 import json
 from typing import List, Dict, Any
 
 async def list_links():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute(
             "SELECT discord_id, roblox_user_id, roblox_username, linked_at FROM links ORDER BY linked_at DESC"
         )
         return await cur.fetchall()
 
 async def list_profiles():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute(
             "SELECT roblox_user_id, data, updated_at FROM player_profiles"
         )
@@ -265,8 +554,23 @@ async def list_profiles():
         out[int(roblox_user_id)] = data
     return out
 
+GUILD_SETTINGS_CACHE_TTL_SECONDS = 300  # filet : guild_config_set invalide aussi le cluster propriétaire (IPC)
+GUILD_SETTINGS_CACHE = LRUCache(maxsize=1024, ttl=GUILD_SETTINGS_CACHE_TTL_SECONDS)
+_NO_SETTINGS = {}  # serveur sans config, mis en cache aussi
+
+
 async def get_guild_settings(guild_id: int) -> Optional[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    cached = GUILD_SETTINGS_CACHE.get(int(guild_id))
+    if cached is not None:
+        return dict(cached) if cached else None
+
+    settings = await _load_guild_settings(guild_id)
+    GUILD_SETTINGS_CACHE.set(int(guild_id), settings or _NO_SETTINGS)
+    return dict(settings) if settings else None
+
+
+async def _load_guild_settings(guild_id: int) -> Optional[dict]:
+    async with _connect() as db:
         cur = await db.execute(
             """
             SELECT linked_role_id, vip_role_id, beta_role_id,
@@ -301,7 +605,7 @@ async def upsert_guild_settings(
     admin_log_channel_id: Optional[int] = None,
 ):
     now = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         # On INSERT si absent, sinon UPDATE en conservant les anciennes valeurs si param=None
         await db.execute(
             """
@@ -329,9 +633,14 @@ async def upsert_guild_settings(
             )
         )
         await db.commit()
+    invalidate_guild_settings(guild_id)
+
+
+def invalidate_guild_settings(guild_id: int):
+    GUILD_SETTINGS_CACHE.pop(int(guild_id))
         
 async def save_leaderboard(key: str, data_json: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "INSERT OR REPLACE INTO leaderboard_cache VALUES (?, ?, ?)",
             (str(key), str(data_json), int(time.time()))
@@ -339,7 +648,7 @@ async def save_leaderboard(key: str, data_json: str):
         await db.commit()
 
 async def get_leaderboard(key: str) -> Optional[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute(
             "SELECT data, updated_at FROM leaderboard_cache WHERE key=?",
             (str(key),)
@@ -356,6 +665,66 @@ async def get_leaderboard(key: str) -> Optional[dict]:
 
         return {"key": key, "data": data, "updated_at": updated_at}
 
+
+def _merge_leaderboard_entries(contributions: List[list], top_k: int) -> List[dict]:
+    # dédoublonne par user_id, la plus grande valeur gagne
+    best: Dict[int, dict] = {}
+    for entries in contributions:
+        for e in entries:
+            try:
+                uid = int(e["user_id"])
+                value = int(e["value"])
+            except Exception:
+                continue
+            cur = best.get(uid)
+            if cur is None or value > int(cur["value"]):
+                best[uid] = e
+
+    return sorted(best.values(), key=lambda e: (-int(e["value"]), int(e["user_id"])))[:top_k]
+
+
+async def merge_leaderboard_contribution(
+    key: str,
+    server_id: str,
+    data_json: str,
+    ttl_seconds: int,
+    top_k: int,
+) -> dict:
+    """Store one server's top K, drop stale servers and rebuild the global board in leaderboard_cache."""
+    now = int(time.time())
+    async with _connect() as db:
+        # IMMEDIATE: deux serveurs qui poussent en même temps ne peuvent pas s'écraser le merge
+        await db.execute("BEGIN IMMEDIATE")
+        await db.execute(
+            "INSERT OR REPLACE INTO leaderboard_contributions VALUES (?, ?, ?, ?)",
+            (str(key), str(server_id), str(data_json), now)
+        )
+        await db.execute(
+            "DELETE FROM leaderboard_contributions WHERE key=? AND updated_at<?",
+            (str(key), now - int(ttl_seconds))
+        )
+        cur = await db.execute(
+            "SELECT data FROM leaderboard_contributions WHERE key=?",
+            (str(key),)
+        )
+        rows = await cur.fetchall()
+
+        contributions = []
+        for (raw,) in rows:
+            try:
+                contributions.append(json.loads(raw))
+            except Exception:
+                continue
+
+        merged = _merge_leaderboard_entries(contributions, int(top_k))
+        await db.execute(
+            "INSERT OR REPLACE INTO leaderboard_cache VALUES (?, ?, ?)",
+            (str(key), json.dumps(merged, ensure_ascii=False), now)
+        )
+        await db.commit()
+
+    return {"key": key, "data": merged, "updated_at": now}
+
 async def create_store_purchase(
     discord_id: int,
     roblox_user_id: int,
@@ -363,41 +732,143 @@ async def create_store_purchase(
     item_key: str,
     cost_points: int,
     reward_robux: int,
-) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            """
-            INSERT INTO store_purchases
-            (discord_id, roblox_user_id, roblox_username, item_key, cost_points, reward_robux, created_at, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, 'queued')
-            """,
-            (
-                int(discord_id),
-                int(roblox_user_id),
-                str(roblox_username),
-                str(item_key),
-                int(cost_points),
-                int(reward_robux),
-                int(time.time()),
+    idempotency_key: str,
+) -> dict:
+    """
+    Check points + pending HAND_REMOVE, insert the purchase and enqueue HAND_REMOVE in one
+    BEGIN IMMEDIATE transaction. Replaying the same idempotency_key returns the first purchase.
+    """
+    now = int(time.time())
+    async with _connect() as db:
+        # IMMEDIATE: prend le verrou d'écriture tout de suite -> pas de double achat entre check et insert
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            cur = await db.execute(
+                "SELECT id, action_id FROM store_purchases WHERE idempotency_key=?",
+                (str(idempotency_key),)
             )
-        )
-        await db.commit()
-        return cur.lastrowid
+            row = await cur.fetchone()
+            if row:
+                await db.rollback()
+                return {"ok": True, "duplicate": True, "purchase_id": row[0], "action_id": row[1]}
+
+            cur = await db.execute(
+                "SELECT data FROM player_profiles WHERE roblox_user_id=?",
+                (int(roblox_user_id),)
+            )
+            row = await cur.fetchone()
+            try:
+                points = int(json.loads(row[0]).get("points", 0)) if row else 0
+            except Exception:
+                points = 0
+
+            if points < int(cost_points):
+                await db.rollback()
+                return {"ok": False, "error": "not_enough_points", "points": points}
+
+            cur = await db.execute(
+                "SELECT 1 FROM admin_actions WHERE roblox_user_id=? AND action='HAND_REMOVE' AND done=0 LIMIT 1",
+                (int(roblox_user_id),)
+            )
+            if await cur.fetchone():
+                await db.rollback()
+                return {"ok": False, "error": "pending_purchase", "points": points}
+
+            cur = await db.execute(
+                """
+                INSERT INTO admin_actions (roblox_user_id, action, amount, queued_at, priority)
+                VALUES (?, 'HAND_REMOVE', ?, ?, ?)
+                """,
+                (int(roblox_user_id), int(cost_points), now, ACTION_PRIORITY_STORE)
+            )
+            action_id = cur.lastrowid
+
+            cur = await db.execute(
+                """
+                INSERT INTO store_purchases
+                (discord_id, roblox_user_id, roblox_username, item_key, cost_points, reward_robux,
+                 created_at, status, idempotency_key, action_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)
+                """,
+                (
+                    int(discord_id),
+                    int(roblox_user_id),
+                    str(roblox_username),
+                    str(item_key),
+                    int(cost_points),
+                    int(reward_robux),
+                    now,
+                    str(idempotency_key),
+                    int(action_id),
+                )
+            )
+            purchase_id = cur.lastrowid
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+    return {"ok": True, "duplicate": False, "purchase_id": purchase_id, "action_id": action_id, "points": points}
 
 
 async def set_store_purchase_status(purchase_id: int, status: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         await db.execute(
             "UPDATE store_purchases SET status=? WHERE id=?",
             (str(status), int(purchase_id))
         )
         await db.commit()
 
+
+async def set_store_purchase_status_for_action(action_id: int, status: str):
+    # queued -> applied | failed uniquement (un report rejoué ne fait pas reculer le statut)
+    async with _connect() as db:
+        await db.execute(
+            """
+            UPDATE store_purchases SET status=?
+            WHERE status='queued'
+              AND action_id IN (SELECT ? UNION SELECT id FROM admin_actions WHERE merged_into=?)
+            """,
+            (str(status), int(action_id), int(action_id))
+        )
+        await db.commit()
+
 async def has_pending_action(roblox_user_id: int, action: str) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect() as db:
         cur = await db.execute(
             "SELECT 1 FROM admin_actions WHERE roblox_user_id=? AND action=? AND done=0 LIMIT 1",
             (int(roblox_user_id), str(action))
         )
         row = await cur.fetchone()
         return row is not None
+
+
+async def count_pending_admin_actions() -> int:
+    async with _connect() as db:
+        # idx_admin_actions_pending (partiel, done=0) -> pas de scan de l'historique
+        cur = await db.execute("SELECT COUNT(*) FROM admin_actions WHERE done=0")
+        return int((await cur.fetchone())[0])
+
+
+# ===========================
+# ===== BOT STATE ==========
+# ===========================
+
+async def get_bot_state(key: str) -> Optional[str]:
+    async with _connect() as db:
+        cur = await db.execute("SELECT value FROM bot_state WHERE key=?", (str(key),))
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+
+async def set_bot_state(key: str, value: str):
+    async with _connect() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO bot_state VALUES (?, ?, ?)",
+            (str(key), str(value), int(time.time()))
+        )
+        await db.commit()
+
+
+# timing/compteurs par fonction publique (exposés sur /metrics)
+instrument_module(globals())
@@ -0,0 +1,164 @@
+# db_instrument.py
+# Couche d'instrumentation SQLite pour db.py : chaque statement est chronométré, les lents sont loggés
+# (paramètres masqués), le plan (EXPLAIN QUERY PLAN) est relevé à la première exécution et les
+# scans complets filtrants sur les tables chaudes sont signalés.
+import os
+import re
+import sqlite3
+import time
+from typing import Optional
+
+import aiosqlite
+
+from metrics import Counter, Histogram
+
+SLOW_QUERY_MS = float(os.getenv("SLFO_SLOW_QUERY_MS", "100"))
+HOT_TABLES = {"links", "link_codes", "admin_actions", "player_profiles", "store_purchases", "leaderboard_contributions"}
+STATEMENT_LABEL_CHARS = 120
+
+DB_STATEMENTS = Histogram("slfo_db_statement_seconds", "SQLite statement latency", ("statement",))
+DB_SLOW = Counter("slfo_db_slow_statements_total", "Statements slower than SLFO_SLOW_QUERY_MS", ("statement",))
+DB_LOCK_WAIT = Histogram("slfo_db_lock_wait_seconds", "Time spent acquiring the write lock (BEGIN IMMEDIATE)")
+DB_LOCK_ERRORS = Counter("slfo_db_lock_errors_total", "'database is locked' errors")
+DB_FULL_SCANS = Counter("slfo_db_full_scans_total", "Executions of statements planned as a full scan of a hot table", ("table",))
+
+_plans: dict = {}       # statement normalisé -> [detail, ...]
+_full_scans: dict = {}  # statement normalisé -> tables scannées
+_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+_ALIAS_RE = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_NOT_ALIAS = {"WHERE", "LEFT", "INNER", "JOIN", "ON", "ORDER", "GROUP", "LIMIT", "SET", "VALUES", "USING"}
+
+
+def _normalize(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+def redact(params) -> list:
+    """Parameter shapes only (types / lengths), never values."""
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        return {k: redact([v])[0] for k, v in params.items()}
+    out = []
+    for p in params:
+        if p is None:
+            out.append("NULL")
+        elif isinstance(p, (str, bytes)):
+            out.append(f"<{type(p).__name__} len={len(p)}>")
+        else:
+            out.append(f"<{type(p).__name__}>")
+    return out
+
+
+def _tables_by_alias(sql: str) -> dict:
+    aliases = {}
+    for table, alias in _ALIAS_RE.findall(sql):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.upper() not in _NOT_ALIAS:
+            aliases[alias.lower()] = table.lower()
+    return aliases
+
+
+def _scanned_hot_tables(sql: str, details: list) -> list:
+    # seulement les statements filtrants : un SELECT * sans WHERE (listing) scanne par nature
+    if " WHERE " not in f" {sql.upper()} ":
+        return []
+    aliases = _tables_by_alias(sql)
+    tables = []
+    for detail in details:
+        m = re.match(r"SCAN (\w+)(.*)", detail)
+        if m and "USING" not in m.group(2):
+            table = aliases.get(m.group(1).lower(), m.group(1).lower())
+            if table in HOT_TABLES:
+                tables.append(table)
+    return tables
+
+
+async def _explain(conn: aiosqlite.Connection, key: str, sql: str, params):
+    try:
+        cur = await conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or ())
+        details = [row[3] for row in await cur.fetchall()]
+    except sqlite3.Error as e:
+        details = [f"<explain failed: {e}>"]
+    _plans[key] = details
+
+    scanned = _scanned_hot_tables(sql, details)
+    if scanned:
+        _full_scans[key] = scanned
+        print(f"[DB] full scan of {', '.join(scanned)}: {key[:200]} -> {' | '.join(details)}")
+
+
+class InstrumentedConnection:
+    """Wraps an aiosqlite connection; execute/executemany/commit/rollback are timed."""
+
+    def __init__(self, conn: aiosqlite.Connection):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def execute(self, sql: str, params=None):
+        return await self._run("execute", sql, params, params)
+
+    async def executemany(self, sql: str, seq_of_params):
+        seq = list(seq_of_params)
+        return await self._run("executemany", sql, seq, seq[0] if seq else None)
+
+    async def commit(self):
+        return await self._run("commit", "COMMIT", None, None)
+
+    async def rollback(self):
+        return await self._run("rollback", "ROLLBACK", None, None)
+
+    async def _run(self, method: str, sql: str, params, sample_params):
+        key = _normalize(sql)
+        label = key[:STATEMENT_LABEL_CHARS]
+        started = time.perf_counter()
+        try:
+            if method in ("commit", "rollback"):
+                result = await getattr(self._conn, method)()
+            elif params is None:
+                result = await getattr(self._conn, method)(sql)
+            else:
+                result = await getattr(self._conn, method)(sql, params)
+        except sqlite3.OperationalError as e:
+            if "locked" in str(e) or "busy" in str(e):
+                DB_LOCK_ERRORS.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_STATEMENTS.observe(elapsed, label)
+            if key.upper().startswith("BEGIN IMMEDIATE"):
+                DB_LOCK_WAIT.observe(elapsed)
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                DB_SLOW.inc(label)
+                print(f"[DB] slow statement {elapsed * 1000:.0f}ms: {key[:300]} params={redact(sample_params)}")
+
+        if key not in _plans and key.upper().startswith(_EXPLAINABLE):
+            await _explain(self._conn, key, sql, sample_params)
+        for table in _full_scans.get(key, ()):
+            DB_FULL_SCANS.inc(table)
+        return result
+
+
+class connect:
+    """Drop-in for `aiosqlite.connect(path)` used as `async with`."""
+
+    def __init__(self, path: str):
+        self._cm = aiosqlite.connect(path)
+        self._conn: Optional[InstrumentedConnection] = None
+
+    async def __aenter__(self) -> InstrumentedConnection:
+        self._conn = InstrumentedConnection(await self._cm.__aenter__())
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self._cm.__aexit__(exc_type, exc, tb)
+
+
+def query_report() -> dict:
+    return {
+        "slow_query_ms": SLOW_QUERY_MS,
+        "plans": dict(_plans),
+        "full_scans": dict(_full_scans),
+    }
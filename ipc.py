@@ -0,0 +1,130 @@
+# ipc.py
+# Pont local entre les workers API et le process bot (mode split) :
+# une ligne JSON par effet Discord, {"op": "...", "args": {...}}, sur un socket Unix.
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import tracing
+
+IPC_PATH = os.getenv("SLFO_IPC_PATH", "/tmp/slfo-bot.sock")
+IPC_MAX_LINE = 1_000_000
+IPC_RECONNECT_DELAY_SECONDS = 5.0
+IPC_SEND_TIMEOUT_SECONDS = 1.0  # loop du bot bloquée, socket plein -> on jette plutôt que de bloquer l'API
+
+
+class IPCServer:
+    """Runs in the bot process; dispatches each received op to its handler as a task."""
+
+    def __init__(self, path: str, handlers: Dict[str, Callable[..., Awaitable]]):
+        self.path = path
+        self.handlers = handlers
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: set = set()
+        self.received = 0
+        self.errors = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # socket orphelin d'un ancien process
+        self._server = await asyncio.start_unix_server(self._handle_conn, path=self.path, limit=IPC_MAX_LINE)
+        os.chmod(self.path, 0o600)
+        print(f"[IPC] Listening on {self.path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_conn(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                    handler = self.handlers[msg["op"]]
+                except Exception as e:
+                    self.errors += 1
+                    print("[IPC] bad message:", e)
+                    continue
+
+                self.received += 1
+                task = asyncio.create_task(self._run(msg["op"], handler, msg.get("args") or {}, msg.get("trace")))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except Exception as e:
+            print("[IPC] connection error:", e)
+        finally:
+            writer.close()
+
+    async def _run(self, op: str, handler, args: dict, trace: Optional[dict] = None):
+        try:
+            if trace:
+                # suite de la trace de la requête API côté process bot
+                with tracing.trace(f"ipc {op}", trace_id=trace.get("trace_id"), parent_id=trace.get("parent_id")):
+                    await handler(**args)
+            else:
+                await handler(**args)
+        except Exception as e:
+            self.errors += 1
+            print(f"[IPC] handler {op} failed:", e)
+
+
+class IPCClient:
+    """Used by API workers; fire-and-forget, drops (and logs) when the bot process is unreachable."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._last_failure = 0.0
+        self.sent = 0
+        self.dropped = 0
+
+    async def _connect(self) -> bool:
+        if self._writer is not None and not self._writer.is_closing():
+            return True
+        if time.monotonic() - self._last_failure < IPC_RECONNECT_DELAY_SECONDS:
+            return False
+        try:
+            _, self._writer = await asyncio.open_unix_connection(self.path)
+            return True
+        except OSError as e:
+            self._last_failure = time.monotonic()
+            print("[IPC] bot process unreachable:", e)
+            return False
+
+    async def send(self, op: str, **args):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        msg = {"op": op, "args": args}
+        trace = tracing.propagation()
+        if trace:
+            msg["trace"] = trace
+        line = (json.dumps(msg, ensure_ascii=False) + "\n").encode("utf-8")
+        async with self._lock:
+            for _ in range(2):  # une reconnexion si le bot a redémarré
+                if not await self._connect():
+                    break
+                try:
+                    self._writer.write(line)
+                    await asyncio.wait_for(self._writer.drain(), IPC_SEND_TIMEOUT_SECONDS)
+                    self.sent += 1
+                    return
+                except asyncio.TimeoutError:
+                    # connexion gardée mais bot qui ne lit plus : on coupe et on attend avant de reconnecter
+                    print(f"[IPC] bot process not reading ({IPC_SEND_TIMEOUT_SECONDS}s), resetting connection")
+                    self._writer.close()
+                    self._writer = None
+                    self._last_failure = time.monotonic()
+                    break
+                except (ConnectionError, OSError):
+                    self._writer = None
+            self.dropped += 1
+            print(f"[IPC] dropped op {op}")
@@ -0,0 +1,125 @@
+# join_batcher.py
+# on_member_join en rafale (raid, gros event) : les joins sont regroupés, les links résolus en une requête,
+# les settings viennent du cache et les rôles partent via un worker à débit limité.
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+import discord
+
+from bot_api import TokenBucket
+from db import get_guild_settings, get_links_by_discord_ids
+from member_cache import member_cache
+
+JOIN_BATCH_WINDOW_SECONDS = 0.25
+JOIN_BATCH_MAX = 500
+JOIN_ROLE_EDITS_PER_SECOND = 5.0
+JOIN_LATENCY_SAMPLES = 1000
+
+
+def _percentile(values: list, q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class JoinBatcher:
+    def __init__(self, rate: float = JOIN_ROLE_EDITS_PER_SECOND, window: float = JOIN_BATCH_WINDOW_SECONDS):
+        self.window = window
+        self._pending: deque = deque()  # (member, joined_at)
+        self._flush_task: Optional[asyncio.Task] = None
+        self._roles: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+        self._bucket = TokenBucket(rate=rate, capacity=max(1, int(rate * 2)))
+        self._latencies: deque = deque(maxlen=JOIN_LATENCY_SAMPLES)  # join -> rôle posé (ms)
+        self._stats = {"joins": 0, "batches": 0, "linked": 0, "roles_applied": 0, "errors": 0}
+
+    def submit(self, member: discord.Member):
+        """Non-blocking: called from on_member_join."""
+        self._stats["joins"] += 1
+        self._pending.append((member, time.monotonic()))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._pending:
+            if len(self._pending) < JOIN_BATCH_MAX:
+                await asyncio.sleep(self.window)
+            batch = [self._pending.popleft() for _ in range(min(JOIN_BATCH_MAX, len(self._pending)))]
+            try:
+                await self._process(batch)
+            except Exception as e:
+                self._stats["errors"] += len(batch)
+                print("[BOT] join batch failed:", e)
+
+    async def _process(self, batch: list):
+        self._stats["batches"] += 1
+        links = await get_links_by_discord_ids({int(m.id) for m, _ in batch})
+
+        for member, joined_at in batch:
+            if int(member.id) not in links:
+                continue
+            self._stats["linked"] += 1
+            member_cache.put(member)
+
+            settings = await get_guild_settings(int(member.guild.id))  # en cache
+            linked_role_id = settings.get("linked_role_id") if settings else None
+            role = member.guild.get_role(int(linked_role_id)) if linked_role_id else None
+            if role is None or role in member.roles:
+                continue
+            self._enqueue_role(member, role, joined_at)
+
+    def _enqueue_role(self, member: discord.Member, role: discord.Role, joined_at: float):
+        if self._roles is None:
+            self._roles = asyncio.Queue()
+        self._roles.put_nowait((member, role, joined_at))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._role_worker())
+
+    async def _role_worker(self):
+        # le bucket règle le débit ; les appels eux-mêmes se chevauchent (latence REST)
+        while not self._roles.empty():
+            member, role, joined_at = self._roles.get_nowait()
+            await self._bucket.acquire()
+            task = asyncio.create_task(self._add_role(member, role, joined_at))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _add_role(self, member: discord.Member, role: discord.Role, joined_at: float):
+        try:
+            await member.add_roles(role, reason="SLFO linked user rejoined")
+            member_cache.evict(member.guild.id, member.id)
+            self._stats["roles_applied"] += 1
+            self._latencies.append((time.monotonic() - joined_at) * 1000)
+            print(f"[BOT] Re-applied linked role to {member} ({member.id}) in guild {member.guild.id}")
+        except Exception as e:
+            self._stats["errors"] += 1
+            print("[BOT] Failed to re-apply role on join:", e)
+
+    async def drain(self):
+        """Wait until every submitted join has been processed (bench / shutdown)."""
+        while True:
+            tasks = [t for t in (self._flush_task, self._worker, *self._in_flight) if t and not t.done()]
+            if not tasks:
+                return
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        lat = list(self._latencies)
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+            "role_queue": self._roles.qsize() if self._roles else 0,
+            "in_flight": len(self._in_flight),
+            "join_to_role_ms": {
+                "p50": _percentile(lat, 0.50),
+                "p95": _percentile(lat, 0.95),
+                "max": max(lat) if lat else None,
+            },
+        }
+
+
+join_batcher = JoinBatcher()
@@ -0,0 +1,100 @@
+# loop_monitor.py
+# Retard de planification de la boucle asyncio (uvicorn + discord.py partagent la même en mode single).
+# Une coroutine mesure le retard de réveil ; un thread watchdog capture la pile du thread de la boucle
+# quand elle ne répond plus depuis plus de SLFO_LOOP_STALL_MS (= code bloquant en cours d'exécution).
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+from metrics import Counter, Histogram
+
+LOOP_SAMPLE_INTERVAL_SECONDS = 0.25
+LOOP_STALL_SECONDS = float(os.getenv("SLFO_LOOP_STALL_MS", "250")) / 1000
+LOOP_STALLS_KEPT = 20
+
+LOOP_LAG = Histogram(
+    "slfo_event_loop_lag_seconds",
+    "Event loop scheduling delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_STALLS = Counter("slfo_event_loop_stalls_total", "Event loop stalls longer than the threshold")
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = LOOP_SAMPLE_INTERVAL_SECONDS, threshold: float = LOOP_STALL_SECONDS):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: deque = deque(maxlen=LOOP_STALLS_KEPT)  # derniers blocages (pile incluse)
+        self.max_lag = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._beat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start on the running loop (no-op if already monitoring it)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = loop.create_task(self._sample())
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="slfo-loop-watchdog", daemon=True)
+            self._watchdog.start()
+        print(f"[Loop] lag monitor started (stall threshold {self.threshold * 1000:.0f}ms)")
+
+    async def _sample(self):
+        while True:
+            started = time.monotonic()
+            self._beat = started
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - started - self.interval)
+            LOOP_LAG.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                print(f"[Loop] event loop lag {lag * 1000:.0f}ms")
+
+    def _watch(self):
+        reported_beat = None
+        while True:
+            time.sleep(self.threshold / 4)
+            beat = self._beat
+            stalled_for = time.monotonic() - beat - self.interval
+            if stalled_for < self.threshold or beat == reported_beat:
+                continue
+            reported_beat = beat  # une capture par blocage
+            self._capture(stalled_for)
+
+    def _capture(self, stalled_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+
+        task_name = None
+        try:
+            task = asyncio.current_task(self._loop)  # lecture seule depuis le thread watchdog
+            if task is not None:
+                task_name = f"{task.get_name()} ({task.get_coro().__qualname__})"
+        except Exception:
+            pass
+
+        LOOP_STALLS.inc()
+        self.stalls.append({"at": time.time(), "stalled_ms": round(stalled_for * 1000), "task": task_name, "stack": stack})
+        print(f"[Loop] event loop blocked for {stalled_for * 1000:.0f}ms+ in task {task_name}:\n{stack}")
+
+    def stats(self) -> dict:
+        return {
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": len(self.stalls),
+            "last_stall": self.stalls[-1] if self.stalls else None,
+        }
+
+
+loop_monitor = LoopMonitor()
@@ -1,70 +1,123 @@
 # main.py
 import asyncio
+import os
+import sys
 import uvicorn
 import discord
-from discord.ext import commands
 
 from config import DISCORD_TOKEN, API_HOST, API_PORT, OFFICIAL_GUILD_ID, DEV_GUILD_ID
-from db import init_db, get_link_by_discord, get_guild_settings
+from db import init_db, list_links
 from bot_api import bridge
-from api import app, set_discord_bot
+from username_index import username_index
+from member_cache import member_cache
+from reconcile import reconciler
+from join_batcher import join_batcher
+from loop_monitor import loop_monitor
+from metrics import instrument_discord_http, register_collector, start_http_server as start_metrics_server
+import api
+from api import app, set_discord_bot, DISCORD_EFFECTS
+from ipc import IPC_PATH, IPCServer
 from bot_commands import setup_commands, on_app_command_error
+from startup import ReadyTimer, sync_command_tree
+from sharding import CLUSTER_ID, ShardRouter, cluster_ipc_path, make_bot, shard_stats
 
 intents = discord.Intents.default()
 intents.members = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = make_bot(intents)  # AutoShardedBot si SLFO_SHARD_COUNT est défini
 set_discord_bot(bot)
-@bot.event
-async def on_ready():
+ready_timer = ReadyTimer()
+
+
+def _bot_metrics() -> list:
+    logs = list(bridge.log_stats().values())
+    channels = bridge.channel_stats()
+    members = member_cache.stats()
+    joins = join_batcher.stats()
+    latencies = dict(getattr(bot, "latencies", None) or [(bot.shard_id, bot.latency)])
+    return [
+        ("slfo_shard_latency_seconds", "gauge", "Gateway heartbeat latency",
+         [({"shard": str(s)}, lat) for s, lat in latencies.items() if lat == lat]),
+        ("slfo_shard_events_total", "counter", "Guild-scoped gateway events",
+         [({"shard": str(s)}, n) for s, n in shard_stats.events.items()]),
+        ("slfo_log_embeds_queued", "gauge", "Log embeds waiting in the digest queues",
+         [({}, sum(q["queued"] for q in logs))]),
+        ("slfo_log_embeds_dropped_total", "counter", "Log embeds dropped",
+         [({}, sum(q["dropped"] for q in logs))]),
+        ("slfo_log_messages_sent_total", "counter", "Digest messages sent",
+         [({}, sum(q["sent_messages"] for q in logs))]),
+        ("slfo_channel_resolve_total", "counter", "Channel resolutions by outcome",
+         [({"result": k}, channels[k]) for k in ("hits", "misses", "negative_hits", "fetch_errors")]),
+        ("slfo_member_cache_members", "gauge", "Linked members held in memory", [({}, members["members"])]),
+        ("slfo_member_cache_lookups_total", "counter", "Member lookups by outcome",
+         [({"result": k}, members[k]) for k in ("hits", "misses", "absent_hits", "fetches")]),
+        ("slfo_join_events_total", "counter", "Member joins through the batcher by stage",
+         [({"stage": k}, joins[k]) for k in ("joins", "linked", "roles_applied", "errors")]),
+        ("slfo_join_to_role_seconds", "gauge", "Join to linked-role latency over the last 1000 joins",
+         [({"quantile": q}, v / 1000 if v is not None else None)
+          for q, v in (("0.5", joins["join_to_role_ms"]["p50"]), ("0.95", joins["join_to_role_ms"]["p95"]))]),
+    ]
+
+
+async def setup_hook():
+    # une seule fois par process (pas à chaque reconnexion gateway)
     await init_db()
     bridge.set_bot(bot)
+    instrument_discord_http(bot.http)
+    register_collector(_bot_metrics)
+    links = await list_links()
+    username_index.load(links)
+    member_cache.load(links)
 
     # setup slash commands
     setup_commands(bot.tree)
     bot.tree.on_error = on_app_command_error
-    
+    bot.shard_stats_task = asyncio.create_task(shard_stats.report_loop(bot))
+    reconciler.set_bot(bot)
+    bot.reconcile_task = asyncio.create_task(reconciler.loop())
+
+    if CLUSTER_ID != 0:
+        return  # les commandes sont globales à l'application : seul le cluster 0 synchronise
+
     try:
         if DEV_GUILD_ID and int(DEV_GUILD_ID) != 0:
             guild = discord.Object(id=int(DEV_GUILD_ID))
             bot.tree.copy_global_to(guild=guild)
-            await bot.tree.sync(guild=guild)
-            print(f"[BOT] Slash commands synced to guild {DEV_GUILD_ID}")
+            await sync_command_tree(bot.tree, guild=guild)
         else:
-            await bot.tree.sync()
-            print("[BOT] Slash commands synced globally (peut prendre du temps)")
+            await sync_command_tree(bot.tree)
     except Exception as e:
         print("[BOT] Slash sync error:", e)
 
-    print(f"[BOT] Logged in as {bot.user} (id={bot.user.id})")
+bot.setup_hook = setup_hook
 
-@bot.event
-async def on_member_join(member: discord.Member):
-    # Si le membre est linked en DB, on lui remet le rôle linked du serveur où il rejoint (si configuré)
-    try:
-        link = await get_link_by_discord(member.id)
-        if not link:
-            return
 
-        settings = await get_guild_settings(int(member.guild.id))
-        if not settings:
-            return
+@bot.event
+async def on_ready():
+    ready_timer.ready("ready")
+    print(f"[BOT] Logged in as {bot.user} (id={bot.user.id})")
 
-        linked_role_id = settings.get("linked_role_id")
-        if not linked_role_id:
-            return
+@bot.event
+async def on_resumed():
+    ready_timer.ready("resumed")
 
-        role = member.guild.get_role(int(linked_role_id))
-        if role is None:
-            return
+@bot.event
+async def on_disconnect():
+    ready_timer.disconnected()
 
-        if role in member.roles:
-            return
+@bot.event
+async def on_member_join(member: discord.Member):
+    # Si le membre est linked en DB, on lui remet le rôle linked du serveur où il rejoint (si configuré).
+    # Les joins sont regroupés (join_batcher) : une requête links par lot, rôles à débit limité.
+    if member_cache.is_linked(member.id):
+        join_batcher.submit(member)
 
-        await member.add_roles(role, reason="SLFO linked user rejoined")
-        print(f"[BOT] Re-applied linked role to {member} ({member.id}) in guild {member.guild.id}")
+@bot.event
+async def on_guild_join(guild: discord.Guild):
+    reconciler.schedule(guild.id, "guild_join")
 
-    except Exception as e:
-        print("[BOT] Failed to re-apply role on join:", e)
+@bot.event
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    member_cache.evict(payload.guild_id, payload.user.id, absent=True)
 
 async def start_api():
     config = uvicorn.Config(app, host=API_HOST, port=API_PORT, log_level="info")
@@ -77,5 +130,34 @@ async def main():
     await bot.start(DISCORD_TOKEN)
     api_task.cancel()
 
+# ===== Mode split : API (N workers) et bot dans des process séparés =====
+
+async def run_bot():
+    loop_monitor.start()
+    ipc_server = IPCServer(cluster_ipc_path(IPC_PATH, CLUSTER_ID), DISCORD_EFFECTS)
+    await ipc_server.start()
+    metrics_port = int(os.getenv("SLFO_BOT_METRICS_PORT", "0"))  # pas de FastAPI dans ce process
+    if metrics_port:
+        await start_metrics_server(API_HOST, metrics_port + CLUSTER_ID)
+    try:
+        await bot.start(DISCORD_TOKEN)
+    finally:
+        await ipc_server.close()
+
+def run_api():
+    # les workers uvicorn réimportent api.py : SLFO_MODE=api leur fait créer un client IPC
+    os.environ["SLFO_MODE"] = "api"
+    api.IPC_CLIENT = ShardRouter(IPC_PATH)
+    workers = int(os.getenv("SLFO_API_WORKERS", "2"))
+    print(f"[API] Starting on {API_HOST}:{API_PORT} ({workers} workers, bot via {IPC_PATH})")
+    uvicorn.run("api:app", host=API_HOST, port=API_PORT, workers=workers, log_level="info")
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    # python main.py [single|api|bot]  (ou SLFO_MODE)
+    mode = (sys.argv[1] if len(sys.argv) > 1 else os.getenv("SLFO_MODE", "single")).lower()
+    if mode == "api":
+        run_api()
+    elif mode == "bot":
+        asyncio.run(run_bot())
+    else:
+        asyncio.run(main())
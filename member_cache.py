@@ -0,0 +1,119 @@
+# member_cache.py
+# Cache de membres borné aux utilisateurs linkés : le cache discord.py est désactivé
+# (MemberCacheFlags.none(), pas de chunk au démarrage), on ne garde que les membres dont le discord_id est dans `links`.
+import os
+import time
+from typing import Optional
+
+import discord
+
+from cache import LRUCache
+
+MEMBER_CACHE_MODE = os.getenv("SLFO_MEMBER_CACHE", "linked").lower()  # "linked" | "default"
+MEMBER_CACHE_TTL_SECONDS = 600     # les rôles d'un membre en cache peuvent dériver au plus de ça
+MEMBER_ABSENT_TTL_SECONDS = 600    # "pas dans ce serveur" -> pas de REST à chaque profile update
+MEMBER_ABSENT_CACHE_SIZE = 50_000
+
+
+def member_cache_kwargs() -> dict:
+    """Extra discord.Client kwargs for the configured member cache policy."""
+    if MEMBER_CACHE_MODE == "default":
+        return {}
+    return {"member_cache_flags": discord.MemberCacheFlags.none(), "chunk_guilds_at_startup": False}
+
+
+class LinkedMemberCache:
+    def __init__(self, ttl: float = MEMBER_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._linked: set[int] = set()
+        self._members: dict[int, dict[int, tuple[discord.Member, float]]] = {}  # discord_id -> {guild_id: (member, stored_at)}
+        self._absent = LRUCache(maxsize=MEMBER_ABSENT_CACHE_SIZE, ttl=MEMBER_ABSENT_TTL_SECONDS)
+        self._stats = {"hits": 0, "misses": 0, "absent_hits": 0, "fetches": 0}
+
+    # ===== Linked set =====
+
+    def load(self, rows):
+        """rows = list_links() -> (discord_id, roblox_user_id, roblox_username, linked_at)"""
+        self._linked = {int(r[0]) for r in rows}
+
+    def add_linked(self, discord_id: int):
+        self._linked.add(int(discord_id))
+
+    def remove_linked(self, discord_id: int):
+        self._linked.discard(int(discord_id))
+        self._members.pop(int(discord_id), None)
+
+    def is_linked(self, discord_id: int) -> bool:
+        return int(discord_id) in self._linked
+
+    # ===== Entries =====
+
+    def put(self, member: discord.Member):
+        uid = int(member.id)
+        if uid not in self._linked:
+            return
+        self._members.setdefault(uid, {})[int(member.guild.id)] = (member, time.monotonic())
+        self._absent.pop((int(member.guild.id), uid))
+
+    def evict(self, guild_id: int, discord_id: int, absent: bool = False):
+        """Drop one entry (after our own role edits, or when the member left)."""
+        uid = int(discord_id)
+        per_guild = self._members.get(uid)
+        if per_guild is not None:
+            per_guild.pop(int(guild_id), None)
+            if not per_guild:
+                del self._members[uid]
+        if absent:
+            self._absent.set((int(guild_id), uid), True)
+
+    def cached(self, guild_id: int, discord_id: int) -> Optional[discord.Member]:
+        entry = self._members.get(int(discord_id), {}).get(int(guild_id))
+        if entry is None:
+            return None
+        member, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl:
+            self.evict(guild_id, discord_id)
+            return None
+        return member
+
+    def any_member(self, discord_id: int) -> Optional[discord.Member]:
+        """Any cached guild entry for this user, TTL ignored (display only: names, not roles)."""
+        per_guild = self._members.get(int(discord_id))
+        if not per_guild:
+            return None
+        return next(iter(per_guild.values()))[0]
+
+    async def get(self, guild: discord.Guild, discord_id: int) -> Optional[discord.Member]:
+        """Cached member -> discord.py cache -> REST fetch; None when the user is not in the guild."""
+        uid = int(discord_id)
+        member = self.cached(guild.id, uid) or guild.get_member(uid)
+        if member is not None:
+            self._stats["hits"] += 1
+            self.put(member)
+            return member
+
+        if self._absent.get((int(guild.id), uid)):
+            self._stats["absent_hits"] += 1
+            return None
+
+        self._stats["misses"] += 1
+        self._stats["fetches"] += 1
+        try:
+            member = await guild.fetch_member(uid)
+        except discord.NotFound:
+            self.evict(guild.id, uid, absent=True)
+            return None
+
+        self.put(member)
+        return member
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "linked": len(self._linked),
+            "members": sum(len(g) for g in self._members.values()),
+            "absent": len(self._absent),
+        }
+
+
+member_cache = LinkedMemberCache()
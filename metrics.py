@@ -0,0 +1,225 @@
+# metrics.py
+# Registre de métriques en mémoire, exposé au format texte Prometheus (GET /metrics).
+# Enregistrer = quelques lookups de dict + un bisect : assez léger pour rester actif en prod.
+# Une instance par process (workers uvicorn / process bot séparés -> scraper chacun).
+import bisect
+import functools
+import inspect
+import time
+from typing import Callable, Iterable, Optional
+
+import tracing
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_REGISTRY: list = []
+_COLLECTORS: list = []  # fn() -> [(name, type, help, [(labels dict, value)])], appelés au scrape
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+        _REGISTRY.append(self)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels, value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> list:
+        return self._header() + [
+            f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def render(self) -> list:
+        return self._header() + [
+            f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list:
+        lines = self._header()
+        for k, (counts, total, n) in self._values.items():
+            cumulative = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le_label = 'le="%s"' % _fmt_value(le)
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, k, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, k)} {total!r}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, k)} {n}")
+        return lines
+
+
+def register_collector(fn: Callable[[], list]):
+    _COLLECTORS.append(fn)
+
+
+def render() -> str:
+    lines = []
+    for metric in _REGISTRY:
+        lines += metric.render()
+    for collect in _COLLECTORS:
+        try:
+            families = collect()
+        except Exception as e:
+            print("[Metrics] collector failed:", e)
+            continue
+        for name, mtype, help, samples in families:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {mtype}"]
+            for labels, value in samples:
+                if value is None:
+                    continue
+                names, values = tuple(labels), tuple(labels.values())
+                lines.append(f"{name}{_fmt_labels(names, values)} {_fmt_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ===== Métriques communes =====
+
+HTTP_REQUESTS = Histogram("slfo_http_request_seconds", "API request latency by route", ("method", "route", "status"))
+DB_CALLS = Histogram("slfo_db_call_seconds", "db.py function latency", ("function",))
+DB_ERRORS = Counter("slfo_db_errors_total", "db.py calls that raised", ("function",))
+DISCORD_REST = Histogram("slfo_discord_rest_seconds", "Discord REST call latency", ("method", "route", "status"))
+PROFILE_UPDATES = Counter("slfo_profile_updates_total", "Player profiles ingested through /profile/update")
+ADMIN_QUEUE_DEPTH = Gauge("slfo_admin_queue_depth", "Pending (not done) admin actions")
+
+
+def instrument_module(namespace: dict, histogram: Histogram = DB_CALLS, errors: Optional[Counter] = DB_ERRORS):
+    """Wrap every public coroutine function defined in a module (call at the end of the module)."""
+    module = namespace["__name__"]
+    for name, fn in list(namespace.items()):
+        if name.startswith("_") or not inspect.iscoroutinefunction(fn) or fn.__module__ != module:
+            continue
+        namespace[name] = _timed(fn, name, histogram, errors)
+
+
+def _timed(fn, label: str, histogram: Histogram, errors: Optional[Counter]):
+    span_name = f"db.{label}"
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with tracing.span(span_name):
+                return await fn(*args, **kwargs)
+        except Exception:
+            if errors is not None:
+                errors.inc(label)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started, label)
+    return wrapper
+
+
+def instrument_discord_http(http):
+    """Time every REST call of a discord.py HTTPClient, labelled by route template (low cardinality)."""
+    if getattr(http, "_slfo_instrumented", False):
+        return
+    request = http.request
+
+    async def timed_request(route, *args, **kwargs):
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            with tracing.span(f"discord {route.method} {route.path}"):
+                return await request(route, *args, **kwargs)
+        except Exception as e:
+            status = str(getattr(e, "status", "error"))
+            raise
+        finally:
+            DISCORD_REST.observe(time.perf_counter() - started, route.method, route.path, status)
+
+    http.request = timed_request
+    http._slfo_instrumented = True
+
+
+async def start_http_server(host: str, port: int):
+    """Standalone /metrics for the bot process in split mode (aiohttp ships with discord.py)."""
+    from aiohttp import web
+
+    async def handle(_request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    web_app = web.Application()
+    web_app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[Metrics] Serving /metrics on {host}:{port}")
+    return runner
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route latency, labelled by the route template (not the raw path)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.observe(time.perf_counter() - started, scope["method"], route, f"{status // 100}xx")
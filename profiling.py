@@ -0,0 +1,106 @@
+# profiling.py
+# Profilage à la demande du process en cours (endpoint /admin/profile) ; rien n'est actif hors capture.
+#  - "sample"   : un thread relève les piles de tous les threads toutes les N ms -> piles repliées (flamegraph.pl, speedscope)
+#  - "cprofile" : cProfile sur le thread de la boucle pendant la fenêtre -> texte pstats ou dump binaire .prof
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+PROFILE_MAX_SECONDS = 60
+TRACEMALLOC_FRAMES = 25
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+_lock = threading.Lock()  # une capture à la fois (par process)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _sample_stacks(seconds: float, interval: float) -> tuple:
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks: Counter = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            parts = []
+            while frame is not None:
+                parts.append(_frame_label(frame))
+                frame = frame.f_back
+            parts.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(parts))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def _top_allocations(snapshot: tracemalloc.Snapshot, limit: int = 25) -> list:
+    stats = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    )).statistics("lineno")
+    return [
+        {"where": f"{s.traceback[0].filename}:{s.traceback[0].lineno}", "size_kb": round(s.size / 1024, 1), "count": s.count}
+        for s in stats[:limit]
+    ]
+
+
+async def capture(seconds: float, mode: str = "sample", interval_ms: float = 5.0,
+                  pstats_format: str = "text", with_tracemalloc: bool = False) -> dict:
+    """Profile the running process for `seconds`; raises ProfilerBusy if a capture is already running."""
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    seconds = max(0.1, min(float(seconds), PROFILE_MAX_SECONDS))
+
+    started_tracemalloc = False
+    try:
+        if with_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            started_tracemalloc = True
+
+        out = {"mode": mode, "seconds": seconds}
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()  # thread courant = thread de la boucle
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+
+            if pstats_format == "pstats":
+                profiler.create_stats()
+                out["pstats"] = marshal.dumps(profiler.stats)  # chargeable par pstats / snakeviz
+            else:
+                buf = io.StringIO()
+                pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(60)
+                out["text"] = buf.getvalue()
+        else:
+            loop = asyncio.get_running_loop()
+            stacks, samples = await loop.run_in_executor(None, _sample_stacks, seconds, max(0.001, interval_ms / 1000))
+            out["samples"] = samples
+            out["collapsed"] = "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()) + "\n"
+
+        if with_tracemalloc:
+            out["tracemalloc"] = _top_allocations(tracemalloc.take_snapshot())
+        return out
+    finally:
+        if started_tracemalloc:
+            tracemalloc.stop()
+        _lock.release()
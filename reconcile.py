@@ -0,0 +1,175 @@
+# reconcile.py
+# Réconciliation des rôles LINKED/VIP/BETA par serveur : liste des membres (pages REST de 1000)
+# vs links + profils, en différences d'ensembles ; seules les différences sont appliquées, à débit limité.
+import asyncio
+import os
+import time
+from typing import Optional
+
+import discord
+
+from bot_api import TokenBucket, bridge
+from db import get_guild_settings, list_linked_role_flags
+from member_cache import member_cache
+
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("SLFO_RECONCILE_INTERVAL", "21600"))  # 0 = pas de passe planifiée
+RECONCILE_EDITS_PER_SECOND = 2.0
+RECONCILE_PROGRESS_EVERY = 5000
+
+
+class RoleReconciler:
+    def __init__(self):
+        self._bot: Optional[discord.Client] = None
+        self._running: dict[int, asyncio.Task] = {}
+        self._rerun: dict[int, str] = {}  # demandé pendant une passe -> une passe de plus ensuite
+        self._edit_bucket = TokenBucket(rate=RECONCILE_EDITS_PER_SECOND, capacity=5)
+        self.reports: dict[int, dict] = {}
+
+    def set_bot(self, bot: discord.Client):
+        self._bot = bot
+
+    def schedule(self, guild_id: int, reason: str) -> Optional[asyncio.Task]:
+        """Single-flight per guild: a request during a running pass queues exactly one more pass."""
+        gid = int(guild_id)
+        task = self._running.get(gid)
+        if task is not None and not task.done():
+            self._rerun[gid] = reason
+            return task
+
+        task = asyncio.create_task(self._run(gid, reason))
+        self._running[gid] = task
+        return task
+
+    async def _run(self, guild_id: int, reason: str, flags: Optional[dict] = None):
+        try:
+            while True:
+                guild = self._bot.get_guild(guild_id) if self._bot else None
+                if guild is None:
+                    print(f"[Reconcile] guild {guild_id} not handled by this process, skipped")
+                    return
+                try:
+                    await self.reconcile_guild(guild, reason, flags)
+                except Exception as e:
+                    print(f"[Reconcile] guild {guild_id} failed:", e)
+
+                reason = self._rerun.pop(guild_id, None)
+                if reason is None:
+                    return
+                flags = None  # les links ont pu changer entre-temps
+        finally:
+            self._running.pop(guild_id, None)
+
+    async def reconcile_guild(self, guild: discord.Guild, reason: str, flags: Optional[dict] = None) -> Optional[dict]:
+        settings = await get_guild_settings(int(guild.id))
+        if not settings:
+            return None
+
+        roles = {}
+        for key in ("linked_role_id", "vip_role_id", "beta_role_id"):
+            rid = settings.get(key)
+            role = guild.get_role(int(rid)) if rid else None
+            if role is not None:
+                roles[key] = role
+        if not roles:
+            return None
+
+        started = time.monotonic()
+        if flags is None:
+            flags = await list_linked_role_flags()
+        wanted = {
+            "linked_role_id": set(flags),
+            "vip_role_id": {d for d, (vip, _) in flags.items() if vip},
+            "beta_role_id": {d for d, (_, beta) in flags.items() if beta},
+        }
+
+        # 1) scan : ensembles présents / porteurs de chaque rôle
+        present: set[int] = set()
+        holders = {key: set() for key in roles}
+        async for member in guild.fetch_members(limit=None):
+            uid = int(member.id)
+            present.add(uid)
+            for key, role in roles.items():
+                if member.get_role(role.id) is not None:
+                    holders[key].add(uid)
+            if len(present) % RECONCILE_PROGRESS_EVERY == 0:
+                print(f"[Reconcile] guild {guild.id}: scanned {len(present)} members")
+        scanned_at = time.monotonic()
+
+        # 2) différences
+        edits = []  # (discord_id, role, add)
+        for key, role in roles.items():
+            edits += [(uid, role, True) for uid in (wanted[key] & present) - holders[key]]
+            edits += [(uid, role, False) for uid in holders[key] - wanted[key]]
+
+        # 3) application, à débit limité (partagé entre serveurs)
+        report = {
+            "guild_id": int(guild.id),
+            "reason": reason,
+            "scanned": len(present),
+            "added": 0,
+            "removed": 0,
+            "errors": 0,
+        }
+        for i, (uid, role, add) in enumerate(edits, start=1):
+            await self._edit_bucket.acquire()
+            try:
+                if add:
+                    await self._bot.http.add_role(guild.id, uid, role.id, reason="SLFO role reconcile")
+                    report["added"] += 1
+                else:
+                    await self._bot.http.remove_role(guild.id, uid, role.id, reason="SLFO role reconcile")
+                    report["removed"] += 1
+                member_cache.evict(guild.id, uid)
+            except discord.HTTPException as e:
+                report["errors"] += 1
+                print(f"[Reconcile] guild {guild.id}: role edit failed for {uid}:", e)
+            if i % 100 == 0:
+                print(f"[Reconcile] guild {guild.id}: {i}/{len(edits)} role edits")
+
+        report["scan_seconds"] = round(scanned_at - started, 2)
+        report["apply_seconds"] = round(time.monotonic() - scanned_at, 2)
+        self.reports[int(guild.id)] = report
+        print(
+            f"[Reconcile] guild {guild.id} ({reason}): {report['scanned']} members, "
+            f"+{report['added']} -{report['removed']} roles, {report['errors']} errors "
+            f"in {report['scan_seconds']}s scan + {report['apply_seconds']}s apply"
+        )
+
+        log_id = settings.get("admin_log_channel_id")
+        if log_id and edits:
+            embed = discord.Embed(title="🔄 Role Reconcile", color=0x3498DB)
+            embed.add_field(name="Trigger", value=reason, inline=True)
+            embed.add_field(name="Members", value=str(report["scanned"]), inline=True)
+            embed.add_field(name="Added / Removed", value=f"{report['added']} / {report['removed']}", inline=True)
+            if report["errors"]:
+                embed.add_field(name="Errors", value=str(report["errors"]), inline=True)
+            embed.set_footer(text=f"{report['scan_seconds']}s scan + {report['apply_seconds']}s apply")
+            bridge.post_embed(int(log_id), embed)
+        return report
+
+    async def run_all(self, reason: str = "scheduled"):
+        if self._bot is None:
+            return
+        flags = await list_linked_role_flags()  # une requête pour toute la passe
+        for guild in list(self._bot.guilds):
+            gid = int(guild.id)
+            if gid in self._running:
+                continue
+            task = asyncio.create_task(self._run(gid, reason, flags))
+            self._running[gid] = task
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def loop(self, interval: int = RECONCILE_INTERVAL_SECONDS):
+        """First pass once the bot is ready (catch-up after downtime), then every `interval` seconds."""
+        if interval <= 0 or self._bot is None:
+            return
+        await self._bot.wait_until_ready()
+        while True:
+            try:
+                await self.run_all("scheduled")
+            except Exception as e:
+                print("[Reconcile] scheduled pass failed:", e)
+            await asyncio.sleep(interval)
+
+
+reconciler = RoleReconciler()
@@ -0,0 +1,134 @@
+# sharding.py
+# Cluster de shards : SLFO_SHARD_COUNT shards répartis en SLFO_CLUSTER_COUNT process (SLFO_CLUSTER_ID = ce process).
+import asyncio
+import os
+import time
+from typing import Optional
+
+import discord
+from discord.ext import commands
+
+from ipc import IPCClient
+from member_cache import member_cache_kwargs
+
+SHARD_COUNT = int(os.getenv("SLFO_SHARD_COUNT", "0"))  # 0 = pas de sharding (bot unique, comme avant)
+CLUSTER_COUNT = int(os.getenv("SLFO_CLUSTER_COUNT", "1"))
+CLUSTER_ID = int(os.getenv("SLFO_CLUSTER_ID", "0"))
+SHARD_STATS_INTERVAL_SECONDS = 60
+
+
+def shard_for_guild(guild_id: int, shard_count: int = SHARD_COUNT) -> int:
+    return (int(guild_id) >> 22) % max(1, shard_count)
+
+
+def cluster_shard_ids(cluster_id: int, cluster_count: int = CLUSTER_COUNT, shard_count: int = SHARD_COUNT) -> list[int]:
+    """Shards owned by one cluster process: shard s belongs to cluster s % cluster_count."""
+    if shard_count < cluster_count:
+        raise ValueError(f"SLFO_SHARD_COUNT ({shard_count}) must be >= SLFO_CLUSTER_COUNT ({cluster_count})")
+    if not 0 <= cluster_id < cluster_count:
+        raise ValueError(f"SLFO_CLUSTER_ID ({cluster_id}) must be in [0, {cluster_count})")
+    # réparti en round-robin : un découpage par blocs (ceil) laissait le dernier cluster vide (6/4, 5/4, 9/4),
+    # et AutoShardedBot relance alors *tous* les shards (shard_ids vide -> range(shard_count))
+    shard_ids = list(range(cluster_id, shard_count, cluster_count))
+    if not shard_ids:
+        raise ValueError(f"cluster {cluster_id} would own no shard ({shard_count} shards / {cluster_count} clusters)")
+    return shard_ids
+
+
+def cluster_for_guild(guild_id: int, cluster_count: int = CLUSTER_COUNT, shard_count: int = SHARD_COUNT) -> int:
+    """Cluster owning a guild's shard; same mapping as cluster_shard_ids."""
+    if cluster_count <= 1 or shard_count <= 0:
+        return 0
+    return shard_for_guild(guild_id, shard_count) % cluster_count
+
+
+def cluster_ipc_path(base_path: str, cluster_id: int, cluster_count: int = CLUSTER_COUNT) -> str:
+    return base_path if cluster_count <= 1 else f"{base_path}.{cluster_id}"
+
+
+class ShardStats:
+    """Per-shard event counts (guild-scoped events) and gateway latency."""
+
+    def __init__(self):
+        self.events: dict = {}
+        self._last_events: dict = {}
+        self._last_at = time.monotonic()
+
+    def record(self, args: tuple):
+        shard_id = None
+        if args:
+            first = args[0]
+            guild = first if isinstance(first, discord.Guild) else getattr(first, "guild", None)
+            if isinstance(guild, discord.Guild):
+                shard_id = guild.shard_id
+        self.events[shard_id] = self.events.get(shard_id, 0) + 1
+
+    def snapshot(self, bot: discord.Client) -> dict:
+        now = time.monotonic()
+        elapsed = max(1e-6, now - self._last_at)
+        latencies = dict(getattr(bot, "latencies", None) or [(bot.shard_id, bot.latency)])
+
+        out = {}
+        for shard_id in sorted(set(latencies) | set(self.events), key=lambda s: -1 if s is None else s):
+            total = self.events.get(shard_id, 0)
+            latency = latencies.get(shard_id)
+            out[shard_id] = {
+                "latency_ms": round(latency * 1000, 1) if latency is not None and latency == latency else None,
+                "events": total,
+                "events_per_s": round((total - self._last_events.get(shard_id, 0)) / elapsed, 2),
+            }
+        self._last_events = dict(self.events)
+        self._last_at = now
+        return out
+
+    async def report_loop(self, bot: discord.Client, interval: float = SHARD_STATS_INTERVAL_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            for shard_id, s in self.snapshot(bot).items():
+                print(f"[BOT] shard {shard_id}: latency={s['latency_ms']}ms events/s={s['events_per_s']}")
+
+
+shard_stats = ShardStats()
+
+
+class _StatsMixin:
+    def dispatch(self, event_name: str, /, *args, **kwargs):
+        shard_stats.record(args)
+        super().dispatch(event_name, *args, **kwargs)
+
+
+class SLFOBot(_StatsMixin, commands.Bot):
+    pass
+
+
+class SLFOShardedBot(_StatsMixin, commands.AutoShardedBot):
+    pass
+
+
+def make_bot(intents: discord.Intents) -> commands.Bot:
+    if SHARD_COUNT <= 0:
+        return SLFOBot(command_prefix="!", intents=intents, **member_cache_kwargs())
+
+    shard_ids = cluster_shard_ids(CLUSTER_ID)
+    print(f"[BOT] Cluster {CLUSTER_ID}/{CLUSTER_COUNT}: shards {shard_ids} of {SHARD_COUNT}")
+    return SLFOShardedBot(
+        command_prefix="!",
+        intents=intents,
+        shard_count=SHARD_COUNT,
+        shard_ids=shard_ids,
+        **member_cache_kwargs(),
+    )
+
+
+class ShardRouter:
+    """API side of the IPC bridge: guild-scoped ops go to the owning cluster, the others to every cluster."""
+
+    def __init__(self, base_path: str):
+        self.clients = [IPCClient(cluster_ipc_path(base_path, c)) for c in range(max(1, CLUSTER_COUNT))]
+
+    async def send(self, op: str, route_guild_id: Optional[int] = None, **args):
+        if route_guild_id is not None:
+            await self.clients[cluster_for_guild(route_guild_id)].send(op, **args)
+            return
+        for client in self.clients:
+            await client.send(op, **args)
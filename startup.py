@@ -0,0 +1,60 @@
+# startup.py
+import hashlib
+import json
+import time
+from typing import Optional
+
+import discord
+from discord import app_commands
+
+from db import get_bot_state, set_bot_state
+
+
+def command_tree_hash(tree: app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None) -> str:
+    payload = [cmd.to_dict(tree) for cmd in tree.get_commands(guild=guild)]
+    payload.sort(key=lambda c: (int(c.get("type", 1)), c["name"]))
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def sync_command_tree(tree: app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None) -> bool:
+    """Sync only when the serialized tree changed since the last successful sync (hash kept in bot_state)."""
+    scope = f"guild:{guild.id}" if guild else "global"
+    key = f"command_tree_hash:{tree.client.application_id}:{scope}"
+    digest = command_tree_hash(tree, guild)
+
+    if await get_bot_state(key) == digest:
+        print(f"[BOT] Slash commands unchanged ({scope}), sync skipped")
+        return False
+
+    await tree.sync(guild=guild)
+    await set_bot_state(key, digest)
+    print(f"[BOT] Slash commands synced ({scope})")
+    return True
+
+
+class ReadyTimer:
+    """Logs process-start-to-ready and disconnect-to-ready/resume times."""
+
+    def __init__(self):
+        self._started_at = time.monotonic()
+        self._disconnected_at: Optional[float] = None
+        self.first_ready_done = False
+
+    def disconnected(self):
+        if self._disconnected_at is None:
+            self._disconnected_at = time.monotonic()
+
+    def ready(self, event: str = "ready") -> float:
+        now = time.monotonic()
+        if not self.first_ready_done:
+            elapsed = now - self._started_at
+            print(f"[BOT] {event}: {elapsed:.2f}s since process start")
+            self.first_ready_done = True
+        elif self._disconnected_at is not None:
+            elapsed = now - self._disconnected_at
+            print(f"[BOT] {event}: reconnected in {elapsed:.2f}s")
+        else:
+            elapsed = 0.0
+        self._disconnected_at = None
+        return elapsed
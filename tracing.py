@@ -0,0 +1,264 @@
+# tracing.py
+# Traces légères : un trace id par requête API (propagé via contextvars, et via IPC vers le process bot),
+# un span enfant par appel db.py / appel REST Discord / effet.
+# Export au format span OTLP/JSON : fichier JSONL local et/ou POST vers un collecteur OTLP/HTTP.
+import asyncio
+import contextvars
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from typing import Optional
+
+TRACE_SAMPLE_RATE = float(os.getenv("SLFO_TRACE_SAMPLE_RATE", "0.01"))  # part des traces gardées
+TRACE_SLOW_MS = float(os.getenv("SLFO_TRACE_SLOW_MS", "500"))           # au-delà : toujours gardée
+TRACE_FILE = os.getenv("SLFO_TRACE_FILE", "")                          # ex. traces.jsonl ; "" = pas de fichier
+TRACE_OTLP_URL = os.getenv("SLFO_TRACE_OTLP_URL", "")                  # ex. http://127.0.0.1:4318/v1/traces
+TRACE_MAX_SPANS = 500
+SERVICE_NAME = os.getenv("SLFO_SERVICE_NAME", "slfo")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("slfo_span", default=None)
+_otlp_tasks: set = set()
+_file_queue: queue.Queue = queue.Queue(maxsize=10_000)  # lignes JSONL, écrites par un thread (pas d'I/O disque sur la loop)
+_file_writer: Optional[threading.Thread] = None
+_HEX_ID = {32: re.compile(r"[0-9a-f]{32}"), 16: re.compile(r"[0-9a-f]{16}")}
+stats = {"traces": 0, "kept": 0, "dropped_spans": 0, "export_errors": 0}
+
+
+def _sampled(trace_id: str) -> bool:
+    # décision dérivée du trace id : les process API et bot gardent les mêmes traces
+    return int(trace_id[:8], 16) / 0x100000000 < TRACE_SAMPLE_RATE
+
+
+class _Trace:
+    __slots__ = ("trace_id", "spans", "closed", "error")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: list = []
+        self.closed = False
+        self.error = False
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start_ns", "end_ns", "error")
+
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], attrs: dict):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value):
+        self.attrs[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> dict:
+        out = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 2 if self.parent_id is None else 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in self.attrs.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            out["parentSpanId"] = self.parent_id
+        return out
+
+
+def current() -> Optional[Span]:
+    return _current.get()
+
+
+class span:
+    """Child span of the current trace; a no-op (one ContextVar read) outside a trace."""
+
+    __slots__ = ("name", "attrs", "_span", "_token")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._span = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current.get()
+        if parent is None or parent.trace.closed:
+            return None
+        trace = parent.trace
+        if len(trace.spans) >= TRACE_MAX_SPANS:
+            stats["dropped_spans"] += 1
+            return None
+        self._span = Span(trace, self.name, parent.span_id, self.attrs)
+        trace.spans.append(self._span)
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        s = self._span
+        if s is None:
+            return False
+        s.end_ns = time.time_ns()
+        if exc is not None and not isinstance(exc, asyncio.CancelledError):
+            s.error = repr(exc)[:200]
+            s.trace.error = True
+        _current.reset(self._token)
+        return False
+
+
+class trace(span):
+    """Root span: starts a trace (or continues a remote one) and exports it when it ends."""
+
+    __slots__ = ("trace_id", "parent_id")
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attrs):
+        super().__init__(name, **attrs)
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+
+    def __enter__(self) -> Span:
+        t = _Trace(self.trace_id or secrets.token_hex(16))
+        self._span = Span(t, self.name, self.parent_id, self.attrs)
+        t.spans.append(self._span)
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        super().__exit__(exc_type, exc, tb)
+        t = self._span.trace
+        t.closed = True
+        stats["traces"] += 1
+        if t.error or self._span.duration_ms >= TRACE_SLOW_MS or _sampled(t.trace_id):
+            stats["kept"] += 1
+            _export(t)
+        return False
+
+
+def propagation() -> Optional[dict]:
+    """Context to send along with an IPC message."""
+    s = _current.get()
+    if s is None:
+        return None
+    return {"trace_id": s.trace.trace_id, "parent_id": s.span_id}
+
+
+def parse_traceparent(header: str) -> tuple:
+    """W3C traceparent -> (trace_id, parent_span_id) or (None, None)."""
+    parts = (header or "").strip().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None, None
+    trace_id, parent_id = parts[1], parts[2]
+    # hex minuscule et non nul (W3C) ; sinon nouvelle trace plutôt que de faire confiance à l'en-tête
+    if not _valid_id(trace_id, 32) or not _valid_id(parent_id, 16):
+        return None, None
+    return trace_id, parent_id
+
+
+def _valid_id(value: str, length: int) -> bool:
+    return _HEX_ID[length].fullmatch(value) is not None and value != "0" * length
+
+
+# ===== Export =====
+
+def _export(t: _Trace):
+    spans = [s.to_otlp() for s in t.spans if s.end_ns]
+    if TRACE_FILE:
+        lines = "".join(json.dumps({"service": SERVICE_NAME, **s}, ensure_ascii=False) + "\n" for s in spans)
+        _start_file_writer()
+        try:
+            _file_queue.put_nowait(lines)
+        except queue.Full:
+            stats["export_errors"] += 1
+
+    if TRACE_OTLP_URL:
+        try:
+            task = asyncio.get_running_loop().create_task(_post_otlp(spans))
+        except RuntimeError:
+            return
+        _otlp_tasks.add(task)
+        task.add_done_callback(_otlp_tasks.discard)
+
+
+def _start_file_writer():
+    global _file_writer
+    if _file_writer is None:
+        _file_writer = threading.Thread(target=_write_file, name="slfo-trace-writer", daemon=True)
+        _file_writer.start()
+
+
+def _write_file():
+    while True:
+        batch = [_file_queue.get()]
+        while len(batch) < 500:
+            try:
+                batch.append(_file_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write("".join(batch))
+        except OSError as e:
+            stats["export_errors"] += len(batch)
+            print("[Trace] export failed:", e)
+
+
+async def _post_otlp(spans: list):
+    import httpx
+
+    body = {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "slfo"}, "spans": spans}],
+        }]
+    }
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            await client.post(TRACE_OTLP_URL, json=body)
+    except Exception as e:
+        stats["export_errors"] += 1
+        print("[Trace] OTLP export failed:", e)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware: one root span per HTTP request, x-trace-id on the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+
+        with trace(f"{scope['method']} {scope['path']}", trace_id=trace_id, parent_id=parent_id) as root:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    root.set("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        root.error = f"HTTP {message['status']}"
+                        root.trace.error = True
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-trace-id", root.trace.trace_id.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    root.name = f"{scope['method']} {route.path}"
@@ -0,0 +1,51 @@
+# username_index.py
+import bisect
+
+
+class UsernameIndex:
+    """In-memory, case-folded sorted array of linked Roblox usernames for prefix lookups."""
+
+    def __init__(self):
+        self._keys: list[tuple[str, int]] = []  # (username casefold, roblox_user_id), trié
+        self._names: dict[int, str] = {}         # roblox_user_id -> username affiché
+        self.loaded = False
+
+    def load(self, rows):
+        """rows = list_links() -> (discord_id, roblox_user_id, roblox_username, linked_at)"""
+        self._names = {int(rid): str(name) for _, rid, name, _ in rows}
+        self._keys = sorted((name.casefold(), rid) for rid, name in self._names.items())
+        self.loaded = True
+
+    def add(self, roblox_user_id: int, username: str):
+        rid = int(roblox_user_id)
+        self.remove(rid)
+        self._names[rid] = str(username)
+        bisect.insort(self._keys, (str(username).casefold(), rid))
+
+    def remove(self, roblox_user_id: int):
+        rid = int(roblox_user_id)
+        name = self._names.pop(rid, None)
+        if name is None:
+            return
+        key = (name.casefold(), rid)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def search(self, prefix: str, limit: int = 25) -> list[tuple[str, int]]:
+        p = (prefix or "").strip().casefold()
+        i = bisect.bisect_left(self._keys, (p,))
+        out = []
+        while i < len(self._keys) and len(out) < limit:
+            folded, rid = self._keys[i]
+            if not folded.startswith(p):
+                break
+            out.append((self._names[rid], rid))
+            i += 1
+        return out
+
+    def __len__(self):
+        return len(self._names)
+
+
+username_index = UsernameIndex()